@@ -0,0 +1,418 @@
+import contextlib, io, itertools, os, re, sys, tempfile, unittest, unittest.mock
+
+import words
+
+
+# Runs words.py in a temp dir with small word/format/FNV lists, and compares results with a naive
+# reference that hashes every name (the way words.py used to reverse).
+class WordsTestCase(unittest.TestCase):
+    WORDS = [b'play', b'stop', b'Bgm', b'sfx', b'boss', b'town', b'field', b'hit', b'loop', b'main']
+    FORMATS = [b'%s', b'play_%s', b'%s_loop', b'bgm_%s_main']
+    NAMES = [
+        b'play_boss', b'town_loop', b'bgm_field_main', b'stop', #base words
+        b'play_bgm_town', b'boss_hit_loop', b'sfx_sfx', #combos
+        b'play_stop_boss_hit', b'bgm_town_field_hit_main', #3 words
+    ]
+    FUZZY_NAMES = [b'play_fielx', b'town_boss_loox'] #only found with fuzzy matching
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.dir = self._dir.name
+        self.fnv = words.Fnv()
+
+        self.write('ww.txt', self.WORDS)
+        self.write('formats.txt', self.FORMATS)
+        self.write_targets(self.NAMES + self.FUZZY_NAMES)
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def write(self, name, lines):
+        with open(self.path(name), 'wb') as f:
+            f.write(b'\n'.join(lines) + b'\n')
+
+    def write_targets(self, names):
+        self.targets = set(self.fnv.get_hash(name) for name in names) | {12345}
+        self.write('fnv.txt', [b'%i' % (fnv) for fnv in sorted(self.targets)])
+
+    def read(self, name):
+        with open(self.path(name), 'rb') as f:
+            return f.read()
+
+    # runs words.py with the default lists (plus args), returns printed text
+    def run_words(self, *args, words_class=words.Words, output='out.txt', skips='skips.txt'):
+        argv = ['words.py', '-w', 'none.txt', '-i', 'ww.txt', '-f', 'formats.txt', '-r', 'fnv.txt',
+            '-o', output, '-s', skips] + list(args)
+        cwd = os.getcwd()
+        stdout = io.StringIO()
+        try:
+            os.chdir(self.dir)
+            with unittest.mock.patch.object(sys, 'argv', argv), contextlib.redirect_stdout(stdout):
+                words_class().start()
+        finally:
+            os.chdir(cwd)
+        return stdout.getvalue()
+
+    # (fnv, name) in words_out or skips
+    def read_results(self, name):
+        results = set()
+        for line in self.read(name).decode('utf-8').splitlines():
+            match = re.match(r'^(\d+)\s*: (\S+)$', line)
+            if match:
+                results.add( (int(match.group(1)), match.group(2)) )
+        return results
+
+    # results of hashing every name, like words.py without precalcs
+    def get_expected(self, names, fuzzy=False):
+        targets = self.targets
+        results = set()
+        for name in names:
+            hash = self.fnv.get_hash(name)
+            if not fuzzy:
+                if hash in targets:
+                    results.add( (hash, name.decode('utf-8')) )
+                continue
+            for fnv in targets:
+                if fnv & 0xFFFFFF00 != hash & 0xFFFFFF00:
+                    continue
+                if fnv != hash:
+                    basehash = self.fnv.get_hash(name[:-1])
+                    name = self.fnv.unfuzzy_hashname_hash(fnv, basehash, name)
+                    if not name:
+                        continue
+                results.add( (fnv, name.decode('utf-8')) )
+        return results
+
+    def get_names(self, combos):
+        return [format.replace(b'%s', b'_'.join(combo)) for combo in combos for format in self.FORMATS]
+
+    def check_results(self, expected, output='out.txt', skips='skips.txt'):
+        self.assertTrue(expected)
+        self.assertEqual(self.read_results(output), expected)
+        self.assertEqual(self.read_results(skips), set((fnv, name.lower()) for fnv, name in expected))
+
+
+class ReverseTest(WordsTestCase):
+
+    def test_default(self):
+        self.run_words()
+        self.check_results(self.get_expected(self.get_names([word] for word in self.WORDS), fuzzy=True))
+
+    def test_default_suffixes(self):
+        # more words than FNVs, so targets are unhashed through format suffixes
+        self.run_words('-zd')
+        self.check_results(self.get_expected(self.get_names([word] for word in self.WORDS)))
+
+    def test_combinations(self):
+        self.run_words('-c', '2')
+        self.check_results(self.get_expected(self.get_names(itertools.product(self.WORDS, repeat=2))))
+
+    def test_combinations_unique(self):
+        self.run_words('-c', '3', '-cu')
+        self.check_results(self.get_expected(self.get_names(itertools.permutations(self.WORDS, 3))))
+
+    def test_combinations_fuzzy(self):
+        self.run_words('-c', '3', '-ze')
+        self.check_results(self.get_expected(self.get_names(itertools.product(self.WORDS, repeat=3)), fuzzy=True))
+
+    def test_permutations_meet(self):
+        # few FNVs vs many permutations
+        sections = [[b'play', b'stop', b'bgm', b'sfx'], [b'town', b'boss', b'field', b'sfx'], [b'field', b'hit', b'loop', b'main'], [b'hit', b'main', b'loop', b'boss']]
+        self.write_targets([b'play_town_hit_main', b'bgm_stop_sfx_loop_boss', b'sfx_boss_field_hix'])
+        self.write('ww.txt', b'\n#@section\n'.join(b'\n'.join(section) for section in sections).split(b'\n'))
+        self.write('formats.txt', [b'%s', b'bgm_%s'])
+        self.FORMATS = [b'%s', b'bgm_%s']
+
+        output = self.run_words('-p')
+        self.assertIn("splitting sections", output)
+        self.check_results(self.get_expected(self.get_names(itertools.product(*sections))))
+
+
+class TemplateTest(WordsTestCase):
+    TEMPLATES = [b'%s', b'play_%s_%02d', b'bgm_%[ab]_%s', b'%s_%x_%c']
+
+    def setUp(self):
+        super().setUp()
+        self.write('formats.txt', self.TEMPLATES)
+        self.write('formats_all.txt', [b'%s'] + [b'play_%%s_%02d' % (i) for i in range(100)] +
+            [b'bgm_a_%s', b'bgm_b_%s'] + [b'%%s_%x_%c' % (i, c) for i in range(16) for c in b'abcdefghijklmnopkrstuvwxyz'])
+        self.write_targets([b'play_boss_07', b'play_town_hit_99', b'bgm_b_town', b'bgm_a_stop_loop', b'field_c_x', b'hit_main_f_a', b'play_boss_1'])
+
+    # templates find the same as all their formats
+    def check_templates(self, *args):
+        self.run_words(*args, output='out_all.txt', skips='skips_all.txt')
+        self.run_words('-f', 'formats_all.txt', *args)
+        self.assertEqual(len(self.read_results('out_all.txt')), 3)
+        self.assertEqual(self.read_results('out_all.txt'), self.read_results('out.txt'))
+        self.assertEqual(self.read_results('skips_all.txt'), self.read_results('skips.txt'))
+
+    def test_default(self):
+        self.check_templates('-zd')
+
+    def test_combinations(self):
+        self.check_templates('-c', '2')
+
+
+class FuzzyTail2Test(WordsTestCase):
+    NAMES = [b'play_bozz', b'town_loopzz', b'bgm_field_main_x']
+
+    def test_tail2(self):
+        self.write_targets(self.NAMES)
+        expected = set((self.fnv.get_hash(name), name.decode('utf-8')) for name in self.NAMES)
+
+        self.run_words(output='out_1.txt', skips='skips_1.txt')
+        self.assertFalse(self.read_results('out_1.txt') & expected)
+
+        self.run_words('-z2')
+        self.assertTrue(expected <= self.read_results('out.txt'))
+
+
+class GapFormatsTest(WordsTestCase):
+    NAMES = [b'play_boss_k7', b'play_town_a', b'zq_field']
+
+    def test_gaps(self):
+        self.write_targets(self.NAMES)
+        expected = set((self.fnv.get_hash(name), name.decode('utf-8')) for name in self.NAMES)
+
+        self.run_words(output='out_1.txt', skips='skips_1.txt')
+        self.assertFalse(self.read_results('out_1.txt') & expected)
+
+        output = self.run_words('-gf', 'play_%s_???', '??_%s', 'bad_%s')
+        self.assertIn("creating %i words * 2 gap formats" % (len(self.WORDS)), output)
+        self.assertIn("ignored wrong gap format: b'bad_%s'", output)
+        self.assertEqual(self.read_results('out.txt'), expected)
+
+
+class JoinersTest(WordsTestCase):
+
+    def test_default_joiner(self):
+        self.run_words('-c', '2', output='out_1.txt', skips='skips_1.txt')
+        self.run_words('-c', '2', '-jn', '_')
+        self.assertTrue(self.read_results('out_1.txt'))
+        self.assertEqual(self.read('out.txt'), self.read('out_1.txt'))
+        self.assertEqual(self.read('skips.txt'), self.read('skips_1.txt'))
+
+    def test_joiners(self):
+        names = [b'play_bosshit', b'townloop_loop']
+        self.write_targets(names + [b'play_boss_hit'])
+        expected = set((self.fnv.get_hash(name), name.decode('utf-8')) for name in names)
+
+        self.run_words('-c', '2', output='out_1.txt', skips='skips_1.txt')
+        self.assertFalse(self.read_results('out_1.txt') & expected)
+
+        self.run_words('-c', '2', '-jn', '_,')
+        self.assertEqual(self.read_results('out.txt'), expected | self.read_results('out_1.txt'))
+
+
+class ContextShardsTest(WordsTestCase):
+
+    def test_contexts(self):
+        fnvs = {name: b'# %i' % (self.fnv.get_hash(name)) for name in [b'play_town', b'stop_boss', b'stop_town']}
+        self.write('wwnames.txt', [
+            b'### EVENT NAMES', b'play_boss', fnvs[b'play_town'], fnvs[b'stop_boss'],
+            b'### BUS NAMES', b'bgm_town', fnvs[b'stop_town'],
+        ])
+        self.write('formats.txt', [b'%s', b'play_%s', b'stop_%s'])
+        args = ['-w', 'wwnames.txt', '-i', 'none.txt', '-r', 'none.txt', '-zd']
+
+        # 'town' is only read in BUS, so it can't make EVENT's play_town
+        self.run_words(*args, output='out_1.txt', skips='skips_1.txt')
+        self.assertEqual(set(name for _, name in self.read_results('out_1.txt')), {'play_town', 'stop_boss', 'stop_town'})
+        self.run_words('-cx', *args)
+        self.assertEqual(set(name for _, name in self.read_results('out.txt')), {'stop_boss', 'stop_town'})
+
+
+class BatchTest(WordsTestCase):
+    ARGS = ['-w', 'games/*.txt', '-i', 'none.txt', '-rb', '-c', '2']
+
+    def setUp(self):
+        super().setUp()
+        fnvs = {name: b'# %i' % (self.fnv.get_hash(name)) for name in [b'play_town', b'stop_boss', b'bgm_boss', b'play_boss']}
+        os.mkdir(self.path('games'))
+        self.write('games/a.txt', [b'### EVENT NAMES', b'play_boss', b'stop_town', fnvs[b'play_town'], fnvs[b'stop_boss']])
+        self.write('games/b.txt', [b'### EVENT NAMES', b'bgm_field', fnvs[b'play_town'], fnvs[b'bgm_boss'], fnvs[b'play_boss']])
+        self.write('formats.txt', [b'%s', b'play_%s', b'stop_%s', b'bgm_%s'])
+
+    def get_names(self, file):
+        return set(name for _, name in self.read_results(file))
+
+    # each game gets its results (play_boss is known in a, but not in b)
+    def test_batch(self):
+        self.run_words(*self.ARGS)
+        self.assertEqual(self.get_names('out.txt'), {'play_town', 'stop_boss', 'bgm_boss', 'play_boss'})
+        self.assertEqual(self.get_names('out-games_a.txt'), {'play_town', 'stop_boss'})
+        self.assertEqual(self.get_names('out-games_b.txt'), {'play_town', 'bgm_boss', 'play_boss'})
+
+    def test_batch_resume(self):
+        self.run_words(*self.ARGS)
+        files = {name: self.read(name) for name in ['out.txt', 'out-games_a.txt', 'out-games_b.txt']}
+        os.remove(self.path('skips.txt'))
+
+        with unittest.mock.patch.object(InterruptedWords, 'STOP_UNIT', 2):
+            with self.assertRaises(Interrupted):
+                self.run_words('-ci', '1', *self.ARGS, words_class=InterruptedWords)
+        output = self.run_words('-re', *self.ARGS)
+        self.assertIn("resuming from 2/", output)
+        for name, data in files.items():
+            self.assertEqual(self.read(name), data)
+
+
+class JobsTest(WordsTestCase):
+
+    # jobs results are written in shard order, so files are the same as with 1 process
+    def check_jobs(self, *args):
+        self.run_words('-nj', '1', *args, output='out_1.txt', skips='skips_1.txt')
+        self.run_words('-nj', '3', *args, output='out_3.txt', skips='skips_3.txt')
+        self.assertTrue(self.read_results('out_1.txt'))
+        self.assertEqual(self.read('out_3.txt'), self.read('out_1.txt'))
+        self.assertEqual(self.read('skips_3.txt'), self.read('skips_1.txt'))
+
+    def test_default(self):
+        self.check_jobs()
+
+    def test_combinations(self):
+        self.check_jobs('-c', '3', '-ze')
+
+
+class Interrupted(Exception):
+    pass
+
+# saves a checkpoint on every call (rather than every N seconds), and stops after some units
+class InterruptedWords(words.Words):
+    STOP_UNIT = 4
+
+    def _checkpoint(self, unit):
+        self._checkpoint_time = 1
+        super()._checkpoint(unit)
+        if unit >= self.STOP_UNIT:
+            raise Interrupted()
+
+
+class ResumeTest(WordsTestCase):
+    ARGS = ['-c', '3', '-ze']
+
+    def interrupt(self):
+        with self.assertRaises(Interrupted):
+            self.run_words('-ci', '1', *self.ARGS, words_class=InterruptedWords)
+        self.assertTrue(os.path.exists(self.path('out.txt.checkpoint')))
+
+    def test_resume(self):
+        self.run_words(*self.ARGS, output='out_full.txt', skips='skips_full.txt')
+        self.assertFalse(os.path.exists(self.path('out_full.txt.checkpoint')))
+
+        self.interrupt()
+        output = self.run_words('-re', *self.ARGS)
+        self.assertIn("resuming from %i/" % (InterruptedWords.STOP_UNIT), output)
+        self.assertFalse(os.path.exists(self.path('out.txt.checkpoint')))
+
+        self.assertTrue(self.read_results('out_full.txt'))
+        self.assertEqual(self.read('out.txt'), self.read('out_full.txt'))
+        self.assertEqual(self.read('skips.txt'), self.read('skips_full.txt'))
+
+    def test_resume_missing_files(self):
+        for name in ['out.txt', 'skips.txt']:
+            self.interrupt()
+            os.remove(self.path(name))
+            output = self.run_words('-re', *self.ARGS)
+            self.assertIn("checkpoint file %s not found" % (name), output)
+
+
+@unittest.skipUnless(words.numpy, "numpy not installed")
+class NumpyTest(WordsTestCase):
+
+    # same hits written in the same order (skips aren't sorted)
+    def check_engines(self, *args):
+        self.run_words(*args, output='out_py.txt', skips='skips_py.txt')
+        self.run_words('-e', 'numpy', *args, output='out_np.txt', skips='skips_np.txt')
+        self.assertTrue(self.read_results('out_py.txt'))
+        self.assertEqual(self.read('out_np.txt'), self.read('out_py.txt'))
+        self.assertEqual(self.read('skips_np.txt'), self.read('skips_py.txt'))
+
+    def test_default(self):
+        self.check_engines()
+
+    def test_default_exact(self):
+        self.check_engines('-zd')
+
+    def test_combinations(self):
+        self.check_engines('-c', '2')
+
+    def test_combinations_unique_fuzzy(self):
+        self.check_engines('-c', '3', '-cu', '-ze')
+
+
+class WordArenaTest(WordsTestCase):
+
+    def test_cases(self):
+        arena = words.WordArena()
+        for value in [b'bgm_boss', b'Bgm_Boss', b'BGM_BOSS', b'bgm_boss', b'Bgm_boss']:
+            arena[value.lower()] = value
+        arena[b'town'] = b'Town'
+        self.assertEqual(arena[b'bgm_boss'], b'Bgm_boss')
+        self.assertEqual(list(arena.values()), [b'Bgm_boss', b'Town'])
+        self.assertEqual(len(arena._cases_data), len(b'bgm_boss') + len(b'town'))
+
+    # same results with re-read words in other cases (last case is used)
+    def test_reread_cases(self):
+        self.write('ww.txt', self.WORDS + [word.upper() for word in self.WORDS] + [b'Play', b'Town', b'BOSS', b'boss'])
+        for args in [[], ['-c', '2']]:
+            self.run_words(*args, output='out_1.txt', skips='skips_1.txt')
+            self.run_words('-wa', *args)
+            self.assertTrue(self.read_results('out_1.txt'))
+            self.assertEqual(self.read('out.txt'), self.read('out_1.txt'))
+            self.assertEqual(self.read('skips.txt'), self.read('skips_1.txt'))
+            os.remove(self.path('skips.txt'))
+            os.remove(self.path('skips_1.txt'))
+
+
+class FnvTest(unittest.TestCase):
+
+    def test_unhash(self):
+        fnv = words.Fnv()
+        self.assertEqual(16777619 * fnv.FNV_PRIME_INV & 0xFFFFFFFF, 1)
+        for name in [b'play_bgm', b'x', b'bgm_field_main_loop']:
+            for cut in range(len(name) + 1):
+                self.assertEqual(fnv.get_unhash_nb(fnv.get_hash(name), name[cut:]), fnv.get_hash(name[:cut]))
+
+    def test_unfuzzy(self):
+        fnv = words.Fnv()
+        for name in [b'play_bgm', b'Play_Bgm', b'town_loop_1']:
+            basehash = fnv.get_unhash_nb(fnv.get_hash(name), name[-1:].lower())
+            self.assertEqual(basehash, fnv.get_hash(name[:-1]))
+            self.assertEqual(fnv.unfuzzy_hashname_hash(fnv.get_hash(name), basehash, name[:-1] + b'_'), name)
+
+
+class SkipsStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, 'skips.bin')
+        words.SkipsStore.create(self.path, [b'play_bgm', b'stop_bgm'])
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _check_close_compacted(self, bloom_mb):
+        store = words.SkipsStore(self.path, bloom_mb=bloom_mb)
+        store.add(b'play_sfx')
+        store.close() #log is bigger than 1/8 of sorted hashes, so it's compacted
+        self.assertFalse(os.path.exists(self.path + '.log'))
+
+        store = words.SkipsStore(self.path, bloom_mb=bloom_mb)
+        for name in (b'play_bgm', b'stop_bgm', b'play_sfx'):
+            self.assertIn(name, store)
+        self.assertNotIn(b'stop_sfx', store)
+        store.close()
+
+    def test_close_compacted(self):
+        self._check_close_compacted(None)
+
+    def test_close_compacted_bloom(self):
+        self._check_close_compacted(1)
+
+
+if __name__ == '__main__':
+    unittest.main()
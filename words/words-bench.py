@@ -0,0 +1,282 @@
+# Benchmarks words.py modes with wwnames lists.
+#
+# For each wwnames file, known names are hashed and a part of them is "hidden": visible names
+# are used as words and hidden names' FNVs as the list to reverse. Then words.py is called with
+# each mode, and saves candidates/s, peak RSS, wall time and recall (hidden names found) to a
+# JSON file, to compare runs before and after changes. Older words.py without stats
+# flags also work (only wall time and recall are saved then).
+#
+# Examples:
+#   words-bench.py
+#   - benchmarks a few small wwnames files with all modes (bench.json)
+#   words-bench.py -w "../wwnames/Doom*.txt" -m default c2 -o new.json -cmp bench.json
+#   - benchmarks some files/modes and prints changes vs a previous run
+
+import argparse, glob, os, sys, json, random, re, subprocess, time, datetime, shutil
+
+
+PATTERN_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# modes: name = (flags, words source)
+# - names: visible names as wwnames list (words.py splits them)
+# - combos: most common stems of visible names
+# - sections: most common first/middle/last stems of visible names
+MODES = {
+    'default':  ([], 'names'),
+    'nofuzzy':  (['-zd'], 'names'),
+    'c2':       (['-c', '2'], 'combos'),
+    'c2-fuzzy': (['-c', '2', '-ze'], 'combos'),
+    'c3':       (['-c', '3'], 'combos'),
+    'p':        (['-p'], 'sections'),
+    'fa':       (['-fa'], 'names'),
+    'fam':      (['-fam'], 'names'),
+}
+
+COMBO_WORDS = {'c2': 150, 'c2-fuzzy': 150, 'c3': 40}
+SECTION_WORDS = 25
+
+DIR_BASE = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse():
+    p = argparse.ArgumentParser(description="Benchmarks words.py modes with wwnames lists", formatter_class=argparse.RawTextHelpFormatter)
+    p.add_argument('-w',  '--wwnames-files',    help="wwnames lists to use", default=os.path.join(DIR_BASE, '..', 'wwnames', '*.txt'))
+    p.add_argument('-n',  '--max-files',        help="Max wwnames lists used (0 = all)", type=int, default=3)
+    p.add_argument('-mn', '--min-names',        help="Ignore lists with fewer names", type=int, default=300)
+    p.add_argument('-mx', '--max-names',        help="Ignore lists with more names (0 = any)", type=int, default=3000)
+    p.add_argument('-m',  '--modes',            help="Modes to test: %s" % (', '.join(MODES)), nargs='*', choices=list(MODES), default=list(MODES))
+    p.add_argument('-hr', '--hide-ratio',       help="Part of names to hide (to reverse)", type=float, default=0.25)
+    p.add_argument('-sd', '--seed',             help="Random seed when hiding names", type=int, default=0)
+    p.add_argument('-f',  '--formats-file',     help="Format list file", default=os.path.join(DIR_BASE, 'formats.txt'))
+    p.add_argument('-ws', '--words-script',     help="words.py to benchmark", default=os.path.join(DIR_BASE, 'words.py'))
+    p.add_argument('-a',  '--args',             help="Extra words.py args (ex. -a=\"-e numpy\")", default='')
+    p.add_argument('-t',  '--timeout',          help="Max seconds per run", type=int, default=600)
+    p.add_argument('-o',  '--output-file',      help="Benchmark results", default='bench.json')
+    p.add_argument('-cmp','--compare',          help="Compare results with a previous benchmark file")
+    p.add_argument('-k',  '--keep',             help="Keep work dirs", action='store_true')
+    return p.parse_args()
+
+
+# flags supported by the words.py to benchmark, from its help
+def get_script_flags(script):
+    try:
+        output = subprocess.run([sys.executable, script, '--help'], capture_output=True, text=True, timeout=60).stdout
+    except (OSError, subprocess.SubprocessError):
+        return set()
+    return set(re.findall(r'^\s+(-[\w-]+)', output, re.MULTILINE))
+
+def get_fnv(name):
+    hash = 2166136261
+    for namebyte in name.lower().encode('utf-8'):
+        hash = ((hash * 16777619) ^ namebyte) & 0xFFFFFFFF
+    return hash
+
+def read_names(file):
+    names = {}
+    with open(file, 'r', encoding='utf-8', errors='ignore') as infile:
+        for line in infile:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if not PATTERN_NAME.match(line):
+                continue
+            names.setdefault(line.lower(), line) #first case found
+    return list(names.values())
+
+def get_stems(names, position=None):
+    counts = {}
+    for name in names:
+        stems = [stem for stem in name.lower().split('_') if stem]
+        if position is not None:
+            if len(stems) < 3:
+                continue
+            stems = [stems[position]]
+        for stem in stems:
+            counts[stem] = counts.get(stem, 0) + 1
+    # most common first, then alphabetically to keep order stable
+    return sorted(counts, key=lambda stem: (-counts[stem], stem))
+
+#------------------------------------------------------------------------------
+
+class Workload(object):
+    def __init__(self, args, file):
+        self.file = file
+        self.name = os.path.basename(file)
+
+        names = read_names(file)
+        rnd = random.Random('%s/%s' % (args.seed, self.name))
+        hidden = set(rnd.sample(range(len(names)), int(len(names) * args.hide_ratio)))
+
+        self.visible = [name for i, name in enumerate(names) if i not in hidden]
+        self.hidden = {get_fnv(name): name.lower() for i, name in enumerate(names) if i in hidden}
+
+    def prepare(self, dir, mode):
+        _, source = MODES[mode]
+        os.makedirs(dir, exist_ok=True)
+
+        with open(os.path.join(dir, 'fnv.txt'), 'w') as outfile:
+            outfile.write(''.join('%s\n' % (fnv) for fnv in sorted(self.hidden)))
+
+        words = []
+        if source == 'names':
+            words = ['### BANK NAMES'] + self.visible
+        elif source == 'combos':
+            words = get_stems(self.visible)[0:COMBO_WORDS[mode]]
+        elif source == 'sections':
+            for position in (0, 1, -1):
+                if words:
+                    words.append('#@section')
+                words += get_stems(self.visible, position)[0:SECTION_WORDS]
+
+        with open(os.path.join(dir, 'ww.txt'), 'w', encoding='utf-8') as outfile:
+            outfile.write('\n'.join(words) + '\n')
+
+    # returns (hidden names found, results)
+    def get_recall(self, output_file):
+        found = set()
+        written = 0
+        if os.path.exists(output_file):
+            with open(output_file, 'r', encoding='utf-8', errors='ignore') as infile:
+                for line in infile:
+                    if ':' not in line or line.startswith('#'):
+                        continue
+                    fnv, name = line.split(':', 1)
+                    fnv = int(fnv.strip())
+                    written += 1
+                    if self.hidden.get(fnv) == name.strip().lower():
+                        found.add(fnv)
+        return len(found), written
+
+#------------------------------------------------------------------------------
+
+def run(args, workload, mode, dir, script_flags):
+    flags, source = MODES[mode]
+    workload.prepare(dir, mode)
+
+    # names as wwnames list, or words as input list (no need to split)
+    wwnames_file, input_file = 'ww.txt', 'none.txt'
+    if source != 'names':
+        wwnames_file, input_file = 'none.txt', 'ww.txt'
+
+    output_file = 'words_out.txt'
+    stats_file = 'stats.json'
+    cmd = [sys.executable, os.path.abspath(args.words_script),
+        '-w', wwnames_file, '-i', input_file, '-f', os.path.abspath(args.formats_file), '-r', 'fnv.txt',
+        '-o', output_file, '-s', 'skips.txt'] + flags + args.args.split()
+    if '-sj' in script_flags:
+        cmd += ['-sj', stats_file]
+
+    result = {
+        'file': workload.name,
+        'mode': mode,
+        'flags': flags,
+        'words': len(workload.visible),
+        'hidden': len(workload.hidden),
+        'status': 'ok',
+    }
+
+    start_time = time.time()
+    try:
+        with open(os.path.join(dir, 'log.txt'), 'w') as logfile:
+            subprocess.run(cmd, cwd=dir, stdout=logfile, stderr=subprocess.STDOUT, timeout=args.timeout, check=True)
+    except subprocess.TimeoutExpired:
+        result['status'] = 'timeout'
+    except subprocess.CalledProcessError:
+        result['status'] = 'error'
+    result['wall_seconds'] = time.time() - start_time
+
+    stats = {}
+    try:
+        with open(os.path.join(dir, stats_file), 'r') as infile:
+            stats = json.load(infile)
+    except (OSError, ValueError):
+        pass
+
+    result['candidates'] = stats.get('candidates')
+    result['candidates_per_second'] = stats.get('candidates_per_second')
+    result['peak_rss'] = stats.get('peak_rss')
+    result['phases'] = {name: phase['seconds'] for name, phase in stats.get('phases', {}).items()}
+
+    recovered, written = workload.get_recall(os.path.join(dir, output_file))
+    result['written'] = stats.get('written', written)
+    result['recovered'] = recovered
+    result['recall'] = recovered / len(workload.hidden) if workload.hidden else 0
+    return result
+
+def print_result(result, old=None):
+    rate = result['candidates_per_second'] or 0
+    rss = (result['peak_rss'] or 0) // 0x100000
+    info = "%-40s %-9s %8.2fs %10i c/s %6iMB recall %5.1f%% (%i/%i)" % (
+        result['file'][0:40], result['mode'], result['wall_seconds'], rate, rss,
+        result['recall'] * 100, result['recovered'], result['hidden'])
+    if result['status'] != 'ok':
+        info += ' [%s]' % (result['status'])
+    if old:
+        # by wall time if either run has no stats (older words.py)
+        old_rate = old.get('candidates_per_second') or 0
+        if rate and old_rate:
+            speedup = rate / old_rate
+        else:
+            speedup = old['wall_seconds'] / result['wall_seconds'] if result['wall_seconds'] else 0
+        info += ' | old %8.2fs x%.2f speed, recall %+.1f%%' % (
+            old['wall_seconds'], speedup, (result['recall'] - old['recall']) * 100)
+    print(info)
+
+def load_compare(file):
+    if not file:
+        return {}
+    with open(file, 'r') as infile:
+        bench = json.load(infile)
+    return {(result['file'], result['mode']): result for result in bench['results']}
+
+def main():
+    args = parse()
+    compare = load_compare(args.compare)
+
+    workloads = []
+    for file in sorted(glob.glob(args.wwnames_files)):
+        workload = Workload(args, file)
+        count = len(workload.visible) + len(workload.hidden)
+        if count < args.min_names or args.max_names and count > args.max_names:
+            continue
+        workloads.append(workload)
+        if args.max_files and len(workloads) >= args.max_files:
+            break
+    if not workloads:
+        print("no wwnames lists found")
+        return
+
+    bench = {
+        'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'words_script': os.path.abspath(args.words_script),
+        'args': vars(args),
+        'results': [],
+    }
+
+    script_flags = get_script_flags(args.words_script)
+
+    base_dir = os.path.abspath('bench-work')
+    for workload in workloads:
+        for mode in args.modes:
+            dir = os.path.join(base_dir, '%s-%s' % (re.sub(r'[^A-Za-z0-9]+', '_', workload.name), mode))
+            if os.path.exists(dir):
+                shutil.rmtree(dir)
+
+            result = run(args, workload, mode, dir, script_flags)
+            bench['results'].append(result)
+            print_result(result, compare.get((result['file'], result['mode'])))
+
+            if not args.keep:
+                shutil.rmtree(dir)
+
+            # saved on every run in case of long benchmarks
+            with open(args.output_file, 'w') as outfile:
+                json.dump(bench, outfile, indent=4)
+
+    if not args.keep and os.path.isdir(base_dir) and not os.listdir(base_dir):
+        os.rmdir(base_dir)
+    print("wrote %s" % (args.output_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -47,6 +47,9 @@
 # When reversing it may enable/disable "fuzzy matches" (ignores last letter) to find FNV IDs,
 # as some modes are very prone to false positives.
 #
+# Reversing is done in pure python by default, but if numpy is installed "-e numpy" hashes
+# words in batches (same results, much faster with big word lists).
+#
 # Examples:
 # - from word Play_Stage_01 + format %s (default)
 #   * makes: Play, Stage, 01, Play_Stage, Stage_01, Play_Stage_01
@@ -61,8 +64,14 @@
 #   * with combinator/permutation mode and big word list may take ages and make lots
 #     of false positives, use with care 
 
-import argparse, re, itertools, time, glob, os, datetime
-import fnmatch
+import argparse, re, itertools, time, glob, os, datetime, zlib
+import fnmatch, multiprocessing, threading, queue, hashlib, mmap, struct, array, heapq, json, pickle
+
+# optional, for the vectorized engine
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # TODO:
 # - load words that end with "= 0" as-is for buses (not useful?)
@@ -73,13 +82,26 @@ class Words(object):
     FILENAME_IN = 'ww.txt'
     FILENAME_OUT = 'words_out.txt'
     FILENAME_OUT_EX = 'words_out%s.txt'
+    FILENAME_BATCH_EX = '%s-%s%s' #output + game + extension
     FILENAME_FORMATS = 'formats.txt'
     FILENAME_SKIPS = 'skips.txt'
     FILENAME_REVERSABLES = 'fnv.txt'
+    FILENAME_CHECKPOINT_EX = '%s.checkpoint'
+    CHECKPOINT_INTERVAL = 10 #seconds, when resuming without -ci
+    FILENAME_CACHE_EX = 'words-%s.cache'
+    CACHE_VERSION = 3 #change when parsing changes
+    # args that don't change read words/formats/FNVs (others are part of the cache key)
+    CACHE_IGNORED_ARGS = [
+        'output_file', 'skips_file', 'skips_store', 'skips_bloom', 'delete_empty', 'results_sort', 'results_contexts',
+        'resume', 'checkpoint_interval', 'stats_json', 'cache_dir', 'fuzzy_tail2', 'joiners',
+        'gap_formats', 'gap_alphabet', 'gap_trigrams', 'combo_trigrams', 'combo_trigrams_min',
+        'combinations', 'combinations_unique', 'jobs', 'engine', 'max_chars',
+    ]
     #PATTERN_LINE = re.compile(r'[\t\n\r .<>,;.:{}\[\]()\'"$&/=!\\/#@+\^`´¨?|~*%]')
     PATTERN_LINE = re.compile(b'[^A-Za-z0-9_]')
     PATTERN_WORD = re.compile(b'[_]')
     PATTERN_WRONG = re.compile(b'[^A-Za-z0-9_]')
+    PATTERN_CAPS = re.compile(b'(?<=[a-z])(?=[A-Z0-9])') #getBlah1 > get_Blah_1
     #PATTERN_WRONG = re.compile(r'[\t.<>,;.:{}\[\]()\'"$&/=!\\/#@+\^`´¨?|~*%]')
     WORD_ALLOWED = [b'xiii', b'xviii', b'zzz']
 
@@ -87,19 +109,38 @@ class Words(object):
     FORMAT_TYPE_PREFIX = 1
     FORMAT_TYPE_SUFFIX = 2
     FORMAT_TYPE_BOTH = 3
+    FORMAT_TYPE_TEMPLATE = 4 #format with numbers/letters, expanded when used
+
+    FORMAT_SLOW_DIGITS = 9 #templates with these digits aren't expanded in advance
+    TEMPLATE_TAILS_MAX = 0x10000 #parts after %s are pre-expanded as suffixes up to this
+    WORDS_BLOCK = 0x4000 #base words are hashed in sorted order in blocks of this
+
+    ENGINE_PYTHON = 'python'
+    ENGINE_NUMPY = 'numpy'
+    NUMPY_CHUNK = 0x10000 #words hashed per batch
+    JOBS_SHARDS = 16 #shards per job (smaller = better balance between processes)
+    MEET_LIMIT = 0x400000 #max hashes saved when splitting sections
+    GAP_LIMIT = 0x200000 #max hashes saved per gap format
+    FORMAT_AUTO_KEEP = 0x10000 #min autoformats counted when keeping the most common ones
 
     def __init__(self):
         self._args = None
 
         self._formats = {}
+        self._formats_list = None #expanded formats
+        self._split_fast = None #words split in default mode (see _add_word)
+        self._format_autos = {} #lowercase autoformat > [lines, format] (when keeping the most common ones)
+        self._line_formats = {} #autoformats of current line (counted once per line)
         self._skips = set()
+        self._skips_store = None
         self._reversables = set()
-        self._fuzzies = set()
+        self._fuzzies = {} #fuzzy FNV (no last byte) = list of FNVs
 
         # With dicts we use: words[index] = value, index = lowercase name, value = normal case.
         # When reversing uses lowercase to avoid lower() loops, but normal case when returning results
         self._words = {} #OrderedDict() # dicts are ordered in python 3.7+
         self._words_reversed = set()
+        self._words_total = 0
 
         #self._format_fnvs = {} #stem = base FNV
         #self._format_baselen = {} #stem = base lenth
@@ -107,6 +148,8 @@ class Words(object):
         self._sections = []
         self._sections.append(self._words)
         self._section = 0
+        self._parsing_wwnames = False
+        self._file_contexts = [] #contexts and FNVs in current file
         
         # info about current "### (type) NAMES" where the ID was found (context > ids)
         self._contexts = {}
@@ -115,6 +158,17 @@ class Words(object):
         self._contexts[self._curr_context] = []
         self._ctx_filter = ''
 
+        # contexts that words are matched against (word > patterns, None = all), see _get_shards
+        self._word_targets = {}
+        self._curr_targets = None
+        self._file_targets = None
+        self._shards = None
+
+        # wwnames files (games) and their contexts > FNVs, when reversing all at once
+        self._batch = None
+        self._batch_contexts = None
+        self._batch_targets = None #FNV > indexes of games that have it
+
         self._filter_fnvs = []
         self._filter_names = []
         self._skip_fnvs = []
@@ -122,6 +176,43 @@ class Words(object):
 
         self._fnv = Fnv()
 
+        self._outfile = None
+        self._writer = None
+        self._results = None #results to be written by the main process, when used as a job
+        self._inverted = {}
+        self._tails2 = None
+        self._joiner = None #current joiner when trying multiple joiners
+        self._gaps = None
+        self._gap_alphabet = None
+        self._gap_trigrams = None
+        self._combo_trigrams = None
+        self._meet_split = 0
+        self._unit_levels = 1
+        self._units = 0
+
+        self._checkpoint_time = None
+        self._digest = None
+        self._resume = None
+
+        self._stats = Stats()
+
+    # for multiprocessing (open files can't be passed to jobs, and lists only used by the main process
+    # aren't copied, as they may be big)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_outfile'] = None
+        state['_writer'] = None
+        state['_skips_store'] = None #jobs don't check skips
+        state['_skips'] = set()
+        state['_words_reversed'] = set()
+        state['_format_autos'] = {}
+        state['_contexts'] = {None: []} #results are sorted by context in the main process
+        state['_resume'] = None
+        if state['_batch'] is not None:
+            state['_batch'] = [] #games are written in the main process
+        state['_batch_targets'] = None
+        return state
+
     def _parse(self):
         description = (
             "word generator"
@@ -146,32 +237,51 @@ class Words(object):
         p.add_argument('-o',  '--output-file',  help="Output list", default=self.FILENAME_OUT)
         p.add_argument('-f',  '--formats-file', help="Format list file\n- use %%s to replace a word from input list", default=self.FILENAME_FORMATS)
         p.add_argument('-s',  '--skips-file',   help="List of words to ignore\n(so they arent tested again when doing test variations)", default=self.FILENAME_SKIPS)
+        p.add_argument('-ks', '--skips-store',  help="Use a compact skips file (hashes of names) rather than skips.txt\n(imports skips.txt on first use)")
+        p.add_argument('-kb', '--skips-bloom',  help="Use a bloom filter of N MB to speed up skips store checks\n(saved next to the store)", type=int)
         p.add_argument('-r',  '--reverse-file', help="FNV list to reverse\nOutput will only write words that match FND IDs in the list", default=self.FILENAME_REVERSABLES)
+        p.add_argument('-rb', '--reverse-batch',help="Reverse FNVs of each wwnames file (one per game) in a single pass, and also\nwrite results per file (ex. -w \"games/*.txt\" -rb, ignores -r list)", action='store_true')
         p.add_argument('-to', '--text-output',  help="Write words rather than reversing", action='store_true')
         p.add_argument('-de', '--delete-empty', help="Delete empty output files", action='store_true')
         p.add_argument('-rs', '--results-sort', help="Sort results after processing", action='store_true', default=True)
         p.add_argument('-rc', '--results-contexts',help="Order by #@classify-bank section (if found)", action='store_true', default=True)
+        p.add_argument('-re', '--resume',       help="Resume reversing from last checkpoint\n(must use the same files and flags)", action='store_true')
+        p.add_argument('-ci', '--checkpoint-interval', help="Save checkpoints every N seconds when reversing, to use -re later\n(default: off, or %i when resuming)" % (self.CHECKPOINT_INTERVAL), type=int)
+        p.add_argument('-sj', '--stats-json',   help="Write timings, rates and memory stats to a JSON file at exit")
+        p.add_argument('-cd', '--cache-dir',    help="Save read words/formats/FNVs to this dir, and load them when\nfiles and flags are the same (faster startup)")
         # modes
         p.add_argument('-c',  '--combinations',         help="Combine words in input list by N (repeats words)\nWARNING! don't set high with lots of formats/words")
         p.add_argument('-p',  '--permutations',         help="Permute words in input sections (section 1 * 2 * 3...)\n.End a section in words list and start next with #@section\nWARNING! don't combine many sections+words", action='store_true')
         p.add_argument('-cu', '--combinations-unique',  help="Combine words with unique combos only\nMakes a_b, b_a but not a_a, b_b", action='store_true')
+        p.add_argument('-ct', '--combo-trigrams',       help="Ignore combos where words are joined with uncommon 3-letter combos\n(like 'xq_zz'), from a list like fnv/fnv3.lst (includes joiners)")
+        p.add_argument('-ctm','--combo-trigrams-min',   help="Min count in trigram list to allow a join", type=int, default=1)
         p.add_argument('-zd', '--fuzzy-disable',        help="Disable 'fuzzy matching' (auto last letter) when reversing", action='store_true')
         p.add_argument('-ze', '--fuzzy-enable',         help="Enable 'fuzzy matching' (auto last letter) when reversing", action='store_true')
+        p.add_argument('-z2', '--fuzzy-tail2',          help="Also match names with different last 2 letters, or 1-2 letters added/changed\nat the end when reversing (base words and formats without %%d/%%c only, uses more memory and finds more false positives)", action='store_true')
+        p.add_argument('-cx', '--context-shards',       help="Match words only vs FNVs in the '### (type) NAMES' contexts they were read in\n(or contexts in '#@targets (pattern) ...' lines in word lists, base words only)", action='store_true')
+        p.add_argument('-wa', '--words-arena',          help="Store read words in a compact arena (much less memory with huge word lists,\nslower to read)", action='store_true')
+        p.add_argument('-nj', '--jobs',                 help="Reverse using N processes (same results as 1)", type=int, default=1)
+        p.add_argument('-e',  '--engine',               help="Hashing engine when reversing\n- python: default\n- numpy: hashes words in batches (needs numpy installed)", choices=[self.ENGINE_PYTHON, self.ENGINE_NUMPY], default=self.ENGINE_PYTHON)
 
         # other flags
         p.add_argument('-mc',  '--max-chars',   help="Ignores results that go beyond N chars", type=int)
         p.add_argument('-js', '--join-spaces',  help="Join words with spaces in lines\n('Word Word' = 'Word_Word')", action='store_true')
         p.add_argument('-jb', '--join-blank',   help="Join words without '_'\n('Word' + 'Word' = WordWord instead of Word_Word)", action='store_true')
         p.add_argument('-j',  '--joiner',       help="Set word joiner")
+        p.add_argument('-jn', '--joiners',      help="Try multiple joiners in combinations/permutations, separated by commas\n(ex. \"_,, \" = '_', '' and ' ')")
 
         p.add_argument('-fa', '--format-auto',  help="Auto-makes format combos of (prefix)_%%s_(suffix)", action='store_true')
         p.add_argument('-fam','--format-auto-mix',     help="Autoformats mixes words like blah_blah_blah = blah_%s_blah", action='store_true')
         p.add_argument('-fap','--format-auto-prefix',  help="Autoformats include up to N prefix parts", type=int)
         p.add_argument('-fas','--format-auto-suffix',  help="Autoformats include up to N suffix parts", type=int)
+        p.add_argument('-fat','--format-auto-top',     help="Autoformats keep only the N most common ones (made by more lines)", type=int)
         p.add_argument('-fj', '--format-joiner',help="Set auto-format joiner")
         p.add_argument('-fp', '--format-prefix',help="Add prefixes to all formats", nargs='*')
         p.add_argument('-fs', '--format-suffix',help="Add suffixes to all formats", nargs='*')
         p.add_argument('-fb', '--format-begins',help="Use only auto-formats that begin with text", nargs='*')
+        p.add_argument('-gf', '--gap-formats',  help="Reverse with these formats rather than format list, where ??? is a gap\nof 1..N unknown chars (ex. bgm_%%s_??? or ???_%%s, base words only)", nargs='*')
+        p.add_argument('-ga', '--gap-alphabet', help="Chars used to fill gaps", default=str(Fnv.FNV_DICT, 'utf-8'))
+        p.add_argument('-gt', '--gap-trigrams', help="Ignore gaps with uncommon 3-letter combos, from a list like fnv/fnv3.lst")
         p.add_argument('-iw', '--ignore-wrong', help="Ignores words that don't make much sense\nMay remove unusual valid words, like rank_sss", action='store_true')
         p.add_argument('-ho', '--hashable-only',help="Consider only hashable chunks", action='store_true')
         p.add_argument('-ao', '--alpha-only',   help="Ignores words with numbers (no play_12345)", action='store_true')
@@ -192,6 +302,8 @@ class Words(object):
 
     def _reset_contexts(self):
         self._curr_context = None
+        self._curr_targets = None
+        self._file_targets = None
 
     def _is_filtered_internal(self, filters, flag):
        
@@ -212,6 +324,10 @@ class Words(object):
     def _is_skipped(self, filters):
         return self._is_filtered_internal(filters, True)
 
+    # names in current context can be used
+    def _is_names_allowed(self):
+        return not self._is_filtered(self._filter_names) and not self._is_skipped(self._skip_names)
+
     def _read_format_flags(self, elem):
         # use only FNV that match these
         if elem.startswith(b'#@filter-fnv'):
@@ -275,6 +391,10 @@ class Words(object):
             self._add_format_pf(format)
             return
 
+        if b'%s' in format:
+            self._add_format_template(format)
+            return
+
         try:
             basepos = 0
             while True:
@@ -370,6 +490,177 @@ class Words(object):
             print("ignoring bad format", e)
             return
         
+    # Formats with %s + numbers/letters (blah_%02d_%s) are compiled into a template of parts (text, or list of
+    # values), that are expanded when needed rather than adding every format (blah_00_%s, blah_01_%s, ...).
+    def _add_format_template(self, format):
+        key = format.lower()
+        if key in self._formats:
+            return
+
+        parts = [] #list of (lowercase, original) values, or (conversion, limit, step) for number ranges
+        digits_max = 0
+        try:
+            basepos = 0
+            while True:
+                st = format.find(b'%', basepos)
+                if st < 0:
+                    break
+                if st > basepos:
+                    literal = format[basepos:st]
+                    parts.append([(literal.lower(), literal)])
+                nxt = format[st+1]
+
+                # string: word goes here
+                if nxt == ord(b's'):
+                    parts.append(None)
+                    basepos = st + 2
+                    continue
+
+                # letters
+                if nxt == ord(b'c'):
+                    items = b'abcdefghijklmnopkrstuvwxyz'
+                    parts.append([(bytes([item]), bytes([item])) for item in items])
+                    basepos = st + 2
+                    continue
+
+                # range
+                if nxt == ord(b'['):
+                    ed = format.index(b']', st)
+                    items = format[st+2:ed]
+                    parts.append([(bytes([item]).lower(), bytes([item])) for item in items])
+                    basepos = ed + 1
+                    continue
+
+                # numbers
+                if nxt in b'0idxX':
+                    ed = st + 1
+
+                    if format[ed] == ord(b'0'):
+                        ed += 1
+
+                    digits = 1
+                    if format[ed] in b'123456789':
+                        digits = int(format[ed:ed+1])
+                        ed += 1
+
+                    if format[ed] in b'id':
+                        base = 10
+                        chars = b'0123456789'
+                    elif format[ed] in b'xX':
+                        base = 16
+                        chars = b'0123456789abcdef'
+                        if format[ed] == ord(b'X'):
+                            chars = chars.upper()
+                    else:
+                        print("unknown format: %s" % (format))
+                        return
+                    ed += 1
+
+                    step = 1
+                    limit = None
+
+                    ed_fmt = ed
+                    for extra in [b':', b'^']:
+                        if ed < len(format) and format[ed] == ord(extra):
+                            ed_stp = format.index(extra, ed + 1)
+                            elem = int(format[ed+1:ed_stp])
+                            ed = ed_stp + 1
+                            if extra == b':':
+                                step = elem
+                            if extra == b'^':
+                                limit = elem
+
+                    conversion = format[st:ed_fmt]
+                    digits_max = max(digits_max, digits)
+
+                    if not limit:
+                        limit = pow(base, digits)
+
+                    if limit == pow(base, digits) and step == 1:
+                        # all values: 1 part per digit (000, 001, ... 999 = 0..9 + 0..9 + 0..9)
+                        for _ in range(digits):
+                            parts.append([(bytes([char]).lower(), bytes([char])) for char in chars])
+                    else:
+                        parts.append( (conversion, limit, step) )
+                    basepos = ed
+                    continue
+
+                print("unknown format")
+                return
+
+        except (ValueError, IndexError) as e:
+            print("ignoring bad format", e)
+            return
+
+        if basepos < len(format):
+            literal = format[basepos:]
+            parts.append([(literal.lower(), literal)])
+
+        # -fp/-fs, in the same order as _add_format_pf
+        pfs = []
+        for pf in (self._args.format_prefix or []) + ['']:
+            pf = pf.encode('utf-8')
+            pfs.append( (pf.lower(), pf, self._fnv.get_hash_nb(pf.lower())) )
+        sfs = [sf.encode('utf-8') for sf in (self._args.format_suffix or [])] + [b'']
+        variants = [(i, sf.lower(), sf) for i in range(len(pfs)) for sf in sfs]
+
+        count = len(variants)
+        for part in parts:
+            count *= self._get_template_count(part)
+
+        # parts after %s are usually small (blah_%s_%03d), so they are handled as a list of suffixes
+        # (faster, and can be unhashed like regular suffixes)
+        word_part = parts.index(None)
+        tails_count = len(variants)
+        for part in parts[word_part + 1:]:
+            tails_count *= self._get_template_count(part)
+
+        tails = None
+        if tails_count <= self.TEMPLATE_TAILS_MAX:
+            tails = []
+            options = [list(self._get_template_options(part)) for part in parts[word_part + 1:]]
+            for values in itertools.product(*options):
+                tail = b''.join(value for value, _ in values)
+                tail_og = b''.join(value_og for _, value_og in values)
+                for pf_index, sf, sf_og in variants:
+                    tails.append( (pf_index, tail + sf, tail_og + sf_og) )
+
+        template = (parts, word_part, pfs, variants, digits_max, count, tails)
+        self._formats[key] = (key, format, self.FORMAT_TYPE_TEMPLATE, template, None, None)
+
+    # (lowercase, original) values of a part
+    def _get_template_options(self, part, word=b'%s'):
+        if part is None:
+            return [(word, b'%s')]
+        if isinstance(part, list):
+            return part
+        return self._get_template_range(part)
+
+    # number of values of a part (without making them)
+    def _get_template_count(self, part):
+        if part is None:
+            return 1
+        if isinstance(part, list):
+            return len(part)
+        return len(range(0, part[1], part[2]))
+
+    def _get_template_range(self, part):
+        conversion, limit, step = part
+        for i in range(0, limit, step):
+            value = conversion % (i)
+            yield value.lower(), value
+
+    # all formats in a template (same order as adding them one by one)
+    def _get_template_formats(self, template):
+        parts, _, pfs, variants, _, _, _ = template
+
+        options = [list(self._get_template_options(part)) for part in parts]
+
+        for values in itertools.product(*options):
+            format = b''.join(value for _, value in values)
+            for pf_index, _, sf in variants:
+                yield pfs[pf_index][1] + format + sf
+
     def _add_format_pf(self, format):
         if self._args.format_prefix:
             for pf in self._args.format_prefix:
@@ -386,11 +677,16 @@ class Words(object):
         self._add_format_main(format)
 
     def _add_format_main(self, format):
-        format_lw = format.lower()
         key = format.lower()
         if key in self._formats:
             return
 
+        self._formats[key] = self._get_format_tuple(format)
+
+    def _get_format_tuple(self, format):
+        format_lw = format.lower()
+        key = format_lw
+
         if format == b'%s':
             type = self.FORMAT_TYPE_NONE
             pre = None
@@ -424,7 +720,7 @@ class Words(object):
         #if suf:
         #    suf = bytes(suf, 'UTF-8')
 
-        self._formats[key] = (val, format, type, pre, suf, pre_fnv)
+        return (val, format, type, pre, suf, pre_fnv)
 
         #index = format.index(b'%')
         #if index:
@@ -459,8 +755,7 @@ class Words(object):
                 elem + joiner + mark,
                 mark + joiner + elem,
             ]
-            for subformat in subformats:
-                self._add_format(subformat)
+            self._add_formats_auto(subformats)
             return
 
         subwords = self.PATTERN_WORD.split(elem)
@@ -499,6 +794,7 @@ class Words(object):
                         combos.append(combo)
 
 
+        formats = []
         for combo in combos:
             if self._args.format_begins:
                 combo_lw = combo.lower()
@@ -516,7 +812,68 @@ class Words(object):
             #    continue
             if self._args.alpha_only and any(char_n < 0x30 and char_n > 0x39 for char_n in combo_hashable): #char.isdigit()
                 continue
-            self._add_format(combo)
+            formats.append(combo)
+        self._add_formats_auto(formats)
+
+    # Lots of lines make lots of autoformats (and each is tried with every word), so they may be counted
+    # by lines that make them instead, to only add the most common ones once all wwnames are read.
+    def _add_formats_auto(self, formats):
+        if not self._args.format_auto_top:
+            for format in formats:
+                self._add_format(format)
+            return
+
+        for format in formats:
+            self._line_formats.setdefault(format.lower(), format)
+
+    def _count_formats_auto_line(self):
+        self._count_formats_auto( (key, 1, format) for key, format in self._line_formats.items() )
+        self._line_formats = {}
+
+    # most common autoformats (ties by format, so it's the same when read in any order/jobs)
+    def _get_formats_auto_top(self, counts, top):
+        return heapq.nsmallest(top, counts, key=lambda key: (-counts[key][0], key))
+
+    def _count_formats_auto(self, items):
+        counts = self._format_autos
+        for key, count, format in items:
+            item = counts.get(key)
+            if item is None:
+                counts[key] = [count, format]
+            else:
+                item[0] += count
+
+        # memory is bounded by dropping the least common once there are too many (so counts are
+        # approximate, but formats common enough to be in the top tend to stay)
+        keep = max(self._args.format_auto_top * 4, self.FORMAT_AUTO_KEEP)
+        if len(counts) > keep * 2:
+            tops = set(self._get_formats_auto_top(counts, keep))
+            self._format_autos = {key: item for key, item in counts.items() if key in tops}
+
+    # adds most common autoformats, most common first (only counting those that are actually added, as
+    # some may be repeats of formats.txt or invalid)
+    def _add_formats_auto_top(self):
+        counts = self._format_autos
+        if not counts:
+            return
+
+        top = self._args.format_auto_top
+        added = 0
+        for key in self._get_formats_auto_top(counts, len(counts)):
+            if added >= top:
+                break
+            if self._add_format_new(counts[key][1]):
+                added += 1
+        print("using %i most common autoformats (of %i)" % (added, len(counts)))
+        self._format_autos = {}
+
+    # adds a format, returns if it's a new valid format
+    def _add_format_new(self, format):
+        key = format.strip().lower()
+        if key in self._formats:
+            return False
+        self._add_format(format)
+        return key in self._formats
 
     #--------------------------------------------------------------------------
 
@@ -536,10 +893,15 @@ class Words(object):
             elem_hashable = elem.lower()
             if not self._fnv.is_hashable(elem_hashable):
                 continue
-            self._skips.add(elem_hashable)
-            self._skips.add(elem)
+            self._skips.add(elem_hashable) #only lowercase is checked
 
     def _read_skips(self, file):
+        if self._args.skips_store:
+            self._read_skips_store(file)
+        else:
+            self._read_skips_text(file)
+
+    def _read_skips_text(self, file):
         try:
             with open(file, 'rb') as infile:
                 for line in infile:
@@ -547,6 +909,18 @@ class Words(object):
         except FileNotFoundError:
             pass
 
+    def _read_skips_store(self, file):
+        store = self._args.skips_store
+        if not os.path.exists(store):
+            print("importing %s to %s" % (file, store))
+            skips = self._skips
+            self._skips = set()
+            self._read_skips_text(file)
+            SkipsStore.create(store, self._skips)
+            self._skips = skips
+
+        self._skips_store = SkipsStore(store, self._args.skips_bloom, compact=not self._resume)
+
     #--------------------------------------------------------------------------
 
     def _add_reversable(self, line):
@@ -557,37 +931,48 @@ class Words(object):
                 self._contexts[self._curr_context] = []
             return
 
-        if self._is_filtered(self._filter_fnvs):
+        key = self._get_reversable(line)
+        if key is None:
             return
+        self._add_reversable_key(key, self._curr_context)
+
+    # FNV in line, if any and allowed by current context
+    def _get_reversable(self, line):
+        if self._is_filtered(self._filter_fnvs):
+            return None
         if self._is_skipped(self._skip_fnvs):
-            return
+            return None
 
         if line.startswith(b'# '): #allow fnv in wwnames.txt with -sm
             line = line[2:]
         if line.startswith(b'#'):
-            return
+            return None
 
         elem = line.strip()
         if not elem:
-            return
+            return None
         if not elem.isdigit():
-            return
+            return None
 
         try:
             key = int(elem)
         except (TypeError, ValueError):
-            return
+            return None
 
         if key < 0xFFF or key > 0xFFFFFFFF:
-            return
-
-        # skip already useful names in wwnames.txt
-        if self._parsing_wwnames:
-            if key in self._words_reversed:
-                return
-
-        self._reversables.add(key)
-        self._contexts[self._curr_context].append(key)
+            return None
+        return key
+
+    def _add_reversable_key(self, key, context):
+        if key not in self._reversables:
+            self._reversables.add(key)
+            fnv = key & 0xFFFFFF00
+            if fnv not in self._fuzzies:
+                self._fuzzies[fnv] = []
+            self._fuzzies[fnv].append(key) #may be smaller than fnv_dict with similar FNVs
+        self._contexts[context].append(key)
+        if self._batch_contexts is not None:
+            self._batch_contexts.setdefault(context, []).append(key)
 
     def _read_reversables(self, file, reset_if_found=False):
         try:
@@ -596,26 +981,33 @@ class Words(object):
                 if reset_if_found:
                     print("ignoring existing wwnames FNV to use external list")
                     self._reversables = set()
+                    self._fuzzies = {}
 
                 for line in infile:
                     self._add_reversable(line)
         except FileNotFoundError:
             pass
 
-        for elem in self._reversables:
-            fnv = elem & 0xFFFFFF00
-            self._fuzzies.add(fnv) #may be smaller than fnv_dict with similar FNVs
-
     #--------------------------------------------------------------------------
 
     def _get_joiner(self):
+        if self._joiner is not None:
+            return self._joiner
+
         joiner = b'_'
         if self._args.join_blank:
             joiner = b''
         if self._args.joiner:
-            joiner = self._args.joiner
+            joiner = self._args.joiner.encode('utf-8')
         return joiner
 
+    # joiners to try when combining words (same words and prefixes for all)
+    def _get_joiners(self):
+        if not self._args.joiners:
+            return [self._get_joiner()]
+        joiners = [joiner.encode('utf-8') for joiner in self._args.joiners.split(',')]
+        return list(dict.fromkeys(joiners))
+
     def _get_format_joiner(self):
         joiner = b'_'
         #if self._args.join_blank:
@@ -631,10 +1023,44 @@ class Words(object):
             return
 
         words = self._words
+        shards = self._args.context_shards
         if self._args.no_split:
             words[elem.lower()] = elem
+            if shards:
+                self._add_word_targets(elem.lower())
             return
 
+        if self._split_fast is None:
+            self._split_fast = self._is_split_fast()
+
+        # Default mode makes all combos of parts ("aa_bb_cc" = "aa", "aa_bb", "aa_bb_cc", "bb", ...), that
+        # with '_' as joiner are slices of elem (no need to join + lower each). Same as the loop below.
+        if self._split_fast:
+            elem_lw = elem.lower()
+            if b'_' not in elem:
+                words[elem_lw] = elem
+                if shards:
+                    self._add_word_targets(elem_lw)
+                return
+
+            starts = []
+            ends = []
+            pos = 0
+            for subword in elem.split(b'_'):
+                starts.append(pos)
+                pos += len(subword)
+                ends.append(pos)
+                pos += 1
+
+            count = len(starts)
+            combos = [(elem_lw[starts[i]:ends[j]], elem[starts[i]:ends[j]])
+                for i in range(count) for j in range(i, count) if starts[i] < ends[j]]
+            words.update(combos)
+            if shards:
+                for combo_hashable, _ in combos:
+                    self._add_word_targets(combo_hashable)
+            return #last combo is elem itself
+
         joiner = self._get_joiner()
 
         subwords = self.PATTERN_WORD.split(elem)
@@ -704,6 +1130,8 @@ class Words(object):
 
             #combo_hashable = bytes(combo_hashable, "UTF-8")
             words[combo_hashable] = combo
+            if shards:
+                self._add_word_targets(combo_hashable)
 
         # add itself (needed when joiner is not _)
         if add_self:
@@ -711,6 +1139,28 @@ class Words(object):
             if self._fnv.is_hashable(elem_hashable):
                 #elem_hashable = bytes(elem_hashable, "UTF-8")
                 words[elem_hashable] = elem
+                if shards:
+                    self._add_word_targets(elem_hashable)
+
+    def _is_split_fast(self):
+        args = self._args
+        if args.split_full or args.split_prefix or args.split_suffix or args.split_both or args.split_number:
+            return False
+        if args.hashable_only or args.alpha_only:
+            return False
+        return self._get_joiner() == b'_'
+
+    # words found in multiple contexts are matched vs all of them
+    def _add_word_targets(self, key, targets=False):
+        if targets is False:
+            targets = self._curr_targets
+        if key in self._word_targets:
+            prev = self._word_targets[key]
+            if prev is None or targets is None:
+                targets = None
+            else:
+                targets = prev | targets
+        self._word_targets[key] = targets
 
     def _is_line_ok(self, line, line_lw):
         #line = line.strip()
@@ -740,56 +1190,79 @@ class Words(object):
         
         if elem.islower() or elem.isupper():
             return elem
-    
-        curr = b''
-        prev = b''
-        for letter in elem:
-            letter_b = bytes([letter])
-            if letter_b.isupper() or letter_b.isdigit():
-                if prev.islower():
-                    curr += b'_'
-                curr += letter_b.lower()
-            else:
-                curr += letter_b
-            prev = letter_b
 
-        return curr
+        return self.PATTERN_CAPS.sub(b'_', elem).lower()
+
+    # handles "#" lines in word lists, returns if context changed
+    def _read_words_flags(self, line):
+        if line.startswith(b'### ') and b' NAMES' in line:
+            self._curr_context = line.strip()
+            self._curr_context_lw = self._curr_context.lower()
+            if self._parsing_wwnames:
+                self._file_contexts.append( (self._curr_context, []) )
+            if self._file_targets is None:
+                self._curr_targets = frozenset([self._curr_context_lw])
+            return True
+
+        # FNVs to reverse in "# (fnv)" comments
+        if self._parsing_wwnames and line.startswith(b'# '):
+            key = self._get_reversable(line)
+            if key is not None:
+                self._file_contexts[-1][1].append(key)
+
+        # section end when using permutations
+        if self._args.permutations and line.startswith(b'#@section'):
+            self._words = self._new_words() #old section is in _sections
+            self._sections.append(self._words)
+            self._section += 1
+            return False
+
+        if line.startswith(b'#@nofuzzy'):
+            self._args.fuzzy_disable = True
+            return False
+
+        # allows partially using autoformats to combine with bigger word lists
+        if line.startswith(b'#@noautoformat'):
+            self._args.format_auto = False
+            return False
+
+        # next words are matched vs contexts like these (with -cx), or vs the current context if empty
+        if line.startswith(b'#@targets'):
+            items = line.split()[1:]
+            self._file_targets = frozenset(item.lower() for item in items) or None
+            self._curr_targets = self._file_targets
+            if not self._file_targets and self._curr_context:
+                self._curr_targets = frozenset([self._curr_context_lw])
+            return False
+
+        # comment
+        return False
 
     def _read_words_lines(self, infile):
         ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         print("reading words: %s (%s)" % (infile.name, ts))
 
+        args = self._args
+        parsing_wwnames = self._parsing_wwnames
+        var_types = b'%d' b'%c' b'%s' b'%f' b'0x%08x' b'%02d' b'%u' b'%4d' b'%10d' #adjacent literals make a single item
+        names_allowed = self._is_names_allowed()
+
         num = 0
         for line in infile:
             num += 1
             if num % 1000000 == 0:
                 print(" %i lines..." % (num))
 
-            if line.startswith(b'### ') and b' NAMES' in line:
-                self._curr_context = line.strip()
-                self._curr_context_lw = self._curr_context.lower()
-                #if self._curr_context not in self._contexts: # in case of repeats
-                #    self._contexts[self._curr_context] = []
-                continue
-
-            # section end when using permutations
-            if self._args.permutations and line.startswith(b'#@section'):
-                self._words = {} #old section is in _sections
-                self._sections.append(self._words)
-                self._section += 1
-                continue
-
-            if line.startswith(b'#@nofuzzy'):
-                self._args.fuzzy_disable = True
-                continue
-
-            # allows partially using autoformats to combine with bigger word lists
-            if line.startswith(b'#@noautoformat'):
-                self._args.format_auto = False
-                continue
+            # FNVs to reverse, filtered later vs names in this and previous files
+            if parsing_wwnames and 0x30 <= line[0] <= 0x39:
+                key = self._get_reversable(line)
+                if key is not None:
+                    self._file_contexts[-1][1].append(key)
 
-            # comment
-            if line.startswith(b'#'):
+            # comments and flags (checked together as most lines aren't)
+            if line[0] == 0x23: #'#'
+                if self._read_words_flags(line):
+                    names_allowed = self._is_names_allowed()
                 continue
 
             if len(line) > 500:
@@ -799,21 +1272,16 @@ class Words(object):
             line = line.strip(b'\r')
             if not line:
                 continue
-            line_lw = line.lower()
 
             # skip wonky words created by strings2
-            if self._args.ignore_wrong and self._is_line_ok(line, line_lw):
+            if args.ignore_wrong and self._is_line_ok(line, line.lower()):
                 continue
 
-            if self._is_filtered(self._filter_names):
-                continue
-            if self._is_skipped(self._skip_names):
+            if not names_allowed:
                 continue
 
             # clean vars
-            var_types = [b'%d' b'%c' b'%s' b'%f' b'0x%08x' b'%02d' b'%u' b'%4d' b'%10d']
-            for var_type in var_types:
-                line = line.replace(var_type, b'')
+            line = line.replace(var_types, b'')
 
             # clean copied fnvs
             if b': ' in line:
@@ -822,18 +1290,20 @@ class Words(object):
                     line = line[index+1:].strip()
 
             # games like Death Stranding somehow have spaces in their names
-            if self._args.join_spaces:
+            if args.join_spaces:
                 line = line.replace(b' ', b'_')
 
-            # when parsing wwnames we may skip the full line
-            if self._parsing_wwnames:
+            # when parsing wwnames we may skip the full line (not in batch mode, as names of a game may be results of others)
+            if parsing_wwnames and self._batch is None:
                 self._add_skip(line, full=True)
 
             elems = self.PATTERN_LINE.split(line)
             for elem in elems:
+                if not elem:
+                    continue
 
                 # convert caps to _ (first so other flags work over this)
-                if self._args.split_caps:
+                if args.split_caps:
                     elem = self._transform_caps(elem)
 
                 # regular elem
@@ -870,11 +1340,127 @@ class Words(object):
             if self._args.format_auto and self._parsing_wwnames:
                 for elem in elems:
                     self._add_format_auto(elem)
+                if args.format_auto_top:
+                    self._count_formats_auto_line()
 
         ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         print("reading done (%s)" % (ts) )
 
 
+    # Reads files (words and FNVs) in a single pass per file. Files may be read in separate processes,
+    # and are added in the same order as if read one by one.
+    def _read_files(self, files, parsing_wwnames):
+        self._parsing_wwnames = parsing_wwnames
+
+        if self._args.jobs > 1 and len(files) > 1:
+            with multiprocessing.Pool(min(self._args.jobs, len(files)), _init_job, (self._get_reader(),)) as pool:
+                for file, result in zip(files, pool.imap(_run_read, files)):
+                    self._add_file(file, result)
+        else:
+            for file in files:
+                if self._is_batch_game():
+                    self._words_reversed = set() #only names in the same game
+                self._read_file(file)
+                self._add_file_fnvs(file, self._file_contexts, self._words_reversed)
+
+        self._parsing_wwnames = False
+        self._batch_contexts = None
+
+    def _read_file(self, file):
+        self._file_contexts = [(None, [])]
+        self._read_words(file)
+
+    # copy of current config, without words (for jobs)
+    def _get_reader(self):
+        reader = Words()
+        reader._args = self._args
+        reader._formats = self._formats
+        reader._filter_fnvs = self._filter_fnvs
+        reader._filter_names = self._filter_names
+        reader._skip_fnvs = self._skip_fnvs
+        reader._skip_names = self._skip_names
+        reader._parsing_wwnames = self._parsing_wwnames
+        reader._batch = self._batch
+        return reader
+
+    # reads a file in a job, from the initial config (returns what was found, added with _add_file)
+    def _read_file_job(self, file):
+        args = self._args
+        fuzzy_disable = args.fuzzy_disable
+        format_auto = args.format_auto
+        formats = self._formats
+
+        self._formats = dict(formats)
+        self._words = self._new_words()
+        self._sections = [self._words]
+        self._skips = set()
+        self._words_reversed = set()
+        self._word_targets = {}
+        self._format_autos = {}
+        self._read_file(file)
+
+        new_formats = list(self._formats.items())[len(formats):] #only autoformats
+        flags = (args.fuzzy_disable, args.format_auto)
+        result = (self._sections, self._skips, self._words_reversed, self._file_contexts, new_formats, flags, self._word_targets,
+            self._format_autos)
+
+        args.fuzzy_disable = fuzzy_disable
+        args.format_auto = format_auto
+        self._formats = formats
+        return result
+
+    def _add_file(self, file, result):
+        sections, skips, words_reversed, contexts, formats, (fuzzy_disable, format_auto), word_targets, format_autos = result
+
+        # a file's first section continues the current one
+        for i, words in enumerate(sections):
+            if i > 0:
+                self._words = self._new_words()
+                self._sections.append(self._words)
+                self._section += 1
+            self._words.update(words)
+
+        self._skips.update(skips)
+        self._words_reversed.update(words_reversed)
+        for key, targets in word_targets.items():
+            self._add_word_targets(key, targets)
+
+        if self._args.format_auto:
+            for key, format in formats:
+                if key not in self._formats:
+                    self._formats[key] = format
+            if format_autos:
+                self._count_formats_auto( (key, count, format) for key, (count, format) in format_autos.items() )
+
+        if fuzzy_disable:
+            self._args.fuzzy_disable = True
+        if not format_auto:
+            self._args.format_auto = False
+
+        if self._is_batch_game():
+            self._add_file_fnvs(file, contexts, words_reversed)
+        else:
+            self._add_file_fnvs(file, contexts, self._words_reversed)
+
+    # FNVs are added once the whole file is read, to skip those of already useful names in wwnames.txt
+    # (in this or previous files, or only in this file when each is a game in batch mode)
+    def _add_file_fnvs(self, file, contexts, words_reversed):
+        if self._is_batch_game():
+            self._batch_contexts = {}
+            self._batch.append( (file, self._batch_contexts) )
+
+        for context, keys in contexts:
+            if context not in self._contexts: # in case of repeats
+                self._contexts[context] = []
+
+            for key in keys:
+                if key in words_reversed:
+                    continue
+                self._add_reversable_key(key, context)
+
+    def _is_batch_game(self):
+        return self._batch is not None and self._parsing_wwnames
+
     def _read_words(self, file):
         try:
             # lines are read as binary (works fine) to simplify and slightly speed up loading
@@ -886,14 +1472,54 @@ class Words(object):
 
     #--------------------------------------------------------------------------
 
-    def _get_formats(self):
+    # templates: return templates as-is rather than expanding them (only some modes can use them)
+    def _get_formats(self, templates=False):
         #formats = []
         #for key in self._formats:
         #    format, format_og, type, sub = self._formats[key]
         #    formats.append(format) #original/lowercase
 
         # pre-loaded
-        return self._formats.values()
+        if templates:
+            return self._formats.values()
+
+        if self._formats_list is None:
+            self._formats_list = self._formats.values()
+
+            if any(full_format[2] == self.FORMAT_TYPE_TEMPLATE for full_format in self._formats_list):
+                formats = {}
+                for key, full_format in self._formats.items():
+                    if full_format[2] != self.FORMAT_TYPE_TEMPLATE:
+                        if key not in formats:
+                            formats[key] = full_format
+                        continue
+
+                    template = full_format[3]
+                    if template[4] >= self.FORMAT_SLOW_DIGITS: #just in case
+                        print("ignored slow format: %s" % (full_format[1]))
+                        continue
+                    for format in self._get_template_formats(template):
+                        full_format = self._get_format_tuple(format)
+                        key = format.lower()
+                        if key not in formats:
+                            formats[key] = full_format
+                self._formats_list = formats.values()
+
+        return self._formats_list
+
+    # templates are only expanded per word in the default python engine
+    def _is_template_engine(self):
+        combine = self._args.combinations or self._args.permutations
+        return not self._args.text_output and not combine and self._args.engine == self.ENGINE_PYTHON
+
+    def _get_formats_count(self, formats):
+        count = 0
+        for full_format in formats:
+            if full_format[2] == self.FORMAT_TYPE_TEMPLATE:
+                count += full_format[3][5]
+            else:
+                count += 1
+        return count
 
     def _get_permutations(self):
         permutations = 1
@@ -907,8 +1533,9 @@ class Words(object):
             permutations *= len(words)
             sections.append(words)
 
-        f_len = len(self._formats)
+        f_len = self._get_formats_count(self._formats.values())
         print("creating %i permutations * %i formats (%s sections)" % (permutations, f_len, len(self._sections)) )
+        self._words_total = permutations
 
         elems = itertools.product(*sections)
 
@@ -921,7 +1548,7 @@ class Words(object):
             words = self._words.keys() #lowercase bytes
 
         w_len = len(words)
-        f_len = len(self._formats)
+        f_len = self._get_formats_count(self._formats.values())
         combinations = int(self._args.combinations)
 
         if self._args.combinations_unique:
@@ -938,6 +1565,7 @@ class Words(object):
 
             elems = itertools.product(words, repeat=combinations)
         print("creating %i combinations * %i formats" % (total, f_len) )
+        self._words_total = total
 
         return elems
 
@@ -948,8 +1576,10 @@ class Words(object):
             words = self._words.keys() #lowercase bytes
 
         w_len = len(words)
-        f_len = len(self._formats)
-        print("creating %i words * %i formats" % (w_len, f_len))
+        if not self._args.gap_formats or self._args.text_output: #printed once gap formats are read
+            f_len = self._get_formats_count(self._formats.values())
+            print("creating %i words * %i formats" % (w_len, f_len))
+        self._words_total = w_len
 
         return words
 
@@ -957,7 +1587,6 @@ class Words(object):
 
     def _write_words(self):
         is_text_output = self._args.text_output
-        no_fuzzy = self._args.fuzzy_disable
 
         # huge memory consumption, not iterator?
         #words = ["_".join(x) for x in self._get_xxx()]
@@ -971,13 +1600,16 @@ class Words(object):
             print("no words found")
             return
 
-        formats = self._get_formats()
+        if self._args.engine == self.ENGINE_NUMPY and not numpy:
+            print("numpy not found, using python engine")
+            self._args.engine = self.ENGINE_PYTHON
+
+        formats = self._get_formats(self._is_template_engine())
         if not formats:
             print("no formats found")
             return
 
         reversables = self._reversables
-        fuzzies = self._fuzzies
         if not is_text_output and not reversables:
             print("no reversable IDs found")
             return
@@ -987,133 +1619,75 @@ class Words(object):
         else:
             print("reversing %i FNVs" % (len(reversables)))
 
-        joiner = self._get_joiner()
-        #joiner = bytes(joiner, 'UTF-8')
-        combine = self._args.combinations or self._args.permutations
+        self._written = 0
+        unit = 0
+        if not is_text_output:
+            self._prepare_reverse(formats)
+
+            if self._resume:
+                if self._resume['units'] != self._units:
+                    print("checkpoint doesn't match current flags")
+                    return
+                unit = self._resume['unit']
+                self._written = self._resume['written']
+                print("resuming from %i/%i" % (unit, self._units))
+
+            formats_count = len(self._gaps) if self._gaps else self._get_formats_count(formats)
+            done_before = self._words_total * unit // self._units if self._units else 0 #empty section
+            self._stats.start_reverse(self._words_total, formats_count, done_before)
 
-        # info
-        info_count = 0
-        info_add = 5000000 // len(formats)
-        info_top = info_add
-        written = 0
         start_time = time.time()
+        done = False
 
         ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         print("writting %s (%s)" % (self._args.output_file, ts))
-        with open(self._args.output_file, 'w') as outfile, open(self._args.skips_file, 'a') as skipfile:
-            for word in words:
-                for full_format in formats:
-                    format, _, type, pre, suf, pre_fnv = full_format
-
-                    if is_text_output:
-                        out = self._get_outword(full_format, word, joiner, combine)
-                        out = str(out, 'utf-8') #for standard linesep'ing
-                        outfile.write(out + '\n')
-                        written += 1
-                        continue
-
-                    # concats, slower (30-50%?)
-                    #out = self._get_outword(full_format, word, joiner, combine)
-                    # inline'd FNV hash, ~5% speedup
-                    #fnv_base = self._fnv.get_hash_lw(out_lower)
-
-                    #----------------------------------------------------------
-                    # MAIN HASHING (inline'd)
-                    #
-                    # 'word' is a list on combos like ("aaa", "bbb") + formats "base_%s".
-                    # Instead of hash("base_aaa_bbb") we can avoid str concat by doing
-                    # hash("base_"), hash("aaa"), hash("_"), hash("bbb") passing output as next seed.
-                    # combos are pre-converted to bytes for a minor speed up too.
-                    hash = 2166136261 #base FNV hash
-
-                    if pre:
-                        hash = pre_fnv
-                        #for namebyte in pre:
-                        #    hash = ((hash * 16777619) ^ namebyte) & 0xFFFFFFFF
-
-                    if combine:
-                        # quick ignore non-hashable
-                        if not pre and 0x30 <= word[0][0] <= 0x39: #.isdigit():
-                            continue
-
-                        len_word = len(word) - 1
-                        for i, subword in enumerate(word):
-                            for namebyte in subword:
-                                hash = ((hash * 16777619) ^ namebyte) & 0xFFFFFFFF
-                            if i < len_word:
-                                for namebyte in joiner:
-                                    hash = ((hash * 16777619) ^ namebyte) & 0xFFFFFFFF
-
+        with open(self._args.output_file, 'a' if self._resume else 'w') as outfile:
+            skipfile = None
+            if not self._skips_store:
+                skipfile = open(self._args.skips_file, 'a')
+            batchfiles = self._open_batch_files()
+            self._outfile = outfile
+            self._writer = ResultWriter(outfile, skipfile, batchfiles)
+
+            try:
+                if is_text_output:
+                    self._write_words_text(words, formats)
+                else:
+                    if self._args.checkpoint_interval:
+                        self._checkpoint_time = time.time() + self._args.checkpoint_interval
+
+                    if self._args.jobs > 1:
+                        self._reverse_words_jobs(unit)
                     else:
-                        # quick ignore non-hashable
-                        if not pre and 0x30 <= word[0] <= 0x39: #.isdigit():
-                            continue
-
-                        for namebyte in word:
-                            hash = ((hash * 16777619) ^ namebyte) & 0xFFFFFFFF
-
-                    if suf:
-                        for namebyte in suf:
-                            hash = ((hash * 16777619) ^ namebyte) & 0xFFFFFFFF
-
-                    fnv_base = hash
-
-                    #----------------------------------------------------------
-
-                    # its ~2-5% faster calc FNV + check if it a target FNV, than checking for skips first (less common)
-                    # non-empty test first = minor speedup if file doesn't exist
-                    #if self._skips and out in self._skips:
-                    #    continue
-
-                    if no_fuzzy and fnv_base not in reversables:
-                        continue
-
-                    fnv_fuzz = fnv_base & 0xFFFFFF00
-                    if fnv_fuzz in fuzzies:
-                        for fnv in reversables:
-                            if self._args.fuzzy_disable:
-                                # regular match
-                                if fnv != fnv_base:
-                                    continue
-                                out_final = self._get_original_case(format, word, joiner)
-                            else:
-                                # multiple fnv may use the same fuzz
-                                if fnv_fuzz != fnv & 0xFFFFFF00:
-                                    continue
-                                out_final = self._get_original_case(format, word, joiner)
-                                if fnv != fnv_base:
-                                    out_lower = self._get_outword(full_format, word, joiner, combine)
-                                    out_final = self._fnv.unfuzzy_hashname_lw(fnv, out_lower, out_final)
-                                    if not out_final: #may happen in rare cases
-                                        continue
-
-                            out_final_lw = out_final.lower()
-                            if out_final_lw in self._skips:
-                                continue
-                            self._skips.add(out_final_lw)
-
-                            # don't print non-useful hashes
-                            if not self._fnv.is_hashable(out_final_lw):
-                                continue
-                            if self._args.max_chars and len(out_final) > self._args.max_chars:
-                                continue
-
-                            out_final = str(out_final, 'utf-8')
-                            outfile.write("%s: %s\n" % (fnv, out_final))
-                            outfile.flush() #reversing is most interesting with lots of loops = slow, keep flushing
-
-                            out_final_lw = str(out_final_lw, 'utf-8')
-                            skipfile.write("%s: %s\n" % (fnv, out_final_lw))
-
-                            written += 1
-
-                info_count += 1
-                if info_count == info_top:
-                    info_top += info_add
-                    print("%i..." % (info_count), word)
-
-
+                        self._reverse_words_range(unit, self._units)
+                done = True
+            finally:
+                try:
+                    self._writer.close()
+                finally:
+                    if skipfile:
+                        skipfile.close()
+                    for batchfile in batchfiles:
+                        batchfile.close()
+                    if self._skips_store:
+                        self._skips_store.close(compact=done) #must be able to resume from checkpoint
+
+            self._outfile = None
+            self._writer = None
+
+        if done and self._checkpoint_time:
+            try:
+                os.remove(self._get_checkpoint_file())
+            except FileNotFoundError:
+                pass
+
+        written = self._written
         print("total %i results" % (written))
+        for joiner, count in self._stats.joiners.items():
+            print("- joiner '%s': %i results" % (joiner, count))
+        if not is_text_output and done:
+            self._stats.update(self._words_total - self._stats.get_done_before(), written)
+            print("reversed", self._stats.get_info())
 
         if written == 0 and self._args.delete_empty:
             os.remove(self._args.output_file)
@@ -1124,40 +1698,1577 @@ class Words(object):
         ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         print("writting done (%s, elapsed %ss)" % (ts, end_time - start_time))
 
+    def _write_words_text(self, words, formats):
+        joiners = self._get_joiners()
+        combine = self._args.combinations or self._args.permutations
+        if not combine:
+            joiners = joiners[0:1]
 
-    def _get_outword(self, full_format, word, joiner, combine):
-        format, _, type, pre, suf, _ = full_format    
+        for word in words:
+            for joiner in joiners:
+                for full_format in formats:
+                    out = self._get_outword(full_format, word, joiner, combine)
+                    out = str(out, 'utf-8') #for standard linesep'ing
+                    self._outfile.write(out + '\n')
+                    self._written += 1
 
-        #if pre:
-        #    pre = pre.decode("utf-8")
-        #if suf:
-        #    suf = suf.decode("utf-8")
+    # Precalcs shared by all words (done before starting jobs)
+    def _prepare_reverse(self, formats):
+        reversables = self._reversables
+        combine = self._args.combinations or self._args.permutations
 
-        if combine:
-            baseword = joiner.join(word)
-        else:
-            baseword = word
+        self._tails2 = None
+        if self._args.fuzzy_tail2:
+            if combine or self._args.engine != self.ENGINE_PYTHON:
+                print("2-letter fuzzy matching only works with base words in the python engine")
+            else:
+                self._tails2 = self._get_tails2()
+                if any(full_format[2] == self.FORMAT_TYPE_TEMPLATE for full_format in formats):
+                    print("2-letter fuzzy matching ignores formats with numbers/letters (%d, %c, etc)")
+
+        self._gaps = None
+        if self._args.gap_formats:
+            if combine:
+                print("gap formats only work with base words")
+            else:
+                # gap formats replace the format list (each tries its gap chars per word)
+                self._gaps = self._get_gaps()
+                if self._gaps:
+                    print("creating %i words * %i gap formats" % (self._words_total, len(self._gaps)))
+                else:
+                    print("creating %i words * %i formats" % (self._words_total, self._get_formats_count(formats)))
+
+        # FNV can be reversed, so instead of hashing suffixes per word (hash("aaa_bgm"), hash("bbb_bgm"), ...)
+        # we can "unhash" targets through each suffix once, and test the word's hash before the suffix.
+        # Only for exact matches, as fuzzy matching needs the final hash. Unhashing is done for all targets,
+        # so it's only worth it when there are more words than targets.
+        self._inverted = {}
+        if self._args.fuzzy_disable and self._words_total >= len(reversables) and not self._tails2 and not self._gaps:
+            sufs = []
+            for full_format in formats:
+                if full_format[2] == self.FORMAT_TYPE_TEMPLATE:
+                    tails = full_format[3][6] or []
+                    sufs += [tail for _, tail, _ in tails]
+                else:
+                    sufs.append(full_format[4])
+
+            for suf in sufs:
+                if not suf or suf in self._inverted:
+                    continue
+                self._inverted[suf] = {self._fnv.get_unhash_nb(fnv, suf): fnv for fnv in reversables}
 
-        # doing "str % (str)" every time is ~40% slower
-        if   type == self.FORMAT_TYPE_NONE:
-            out = baseword
-        elif type == self.FORMAT_TYPE_PREFIX:
-            out = pre + baseword
-        elif type == self.FORMAT_TYPE_SUFFIX:
-            out = baseword + suf
-        else: #prefix+suffix
-            #out = format % (baseword)
-            out = pre + baseword + suf
+        self._shards = None
+        if self._args.context_shards:
+            if combine or self._gaps or self._args.engine != self.ENGINE_PYTHON:
+                print("context shards only work with base words in the python engine")
+            else:
+                self._shards = self._get_shards()
 
-        return out
+        self._combo_trigrams = None
+        if self._args.combo_trigrams:
+            if not combine:
+                print("combo trigrams only work with combinations/permutations")
+            else:
+                trigrams = self._read_trigrams(self._args.combo_trigrams, self._args.combo_trigrams_min)
+                if trigrams:
+                    self._combo_trigrams = trigrams[1]
 
-    # when reversing format/word are lowercase, but we have regular case saved to get original combo
-    def _get_original_case(self, format, word, joiner):
-        _, format_og, _type, _pre, _suf, _pre_fnv = self._formats[format]
+        self._meet_split = 0
+        if self._args.permutations and self._args.fuzzy_disable and self._args.engine == self.ENGINE_PYTHON:
+            self._meet_split = self._get_meet_split(formats)
 
+        # Reversing goes through "units" of words in order (to split work between jobs or resume): base words,
+        # first word of combos/sections, or first + second word of combos/sections in bigger trees
         if self._args.permutations:
-            word_og = []
-            i = 0
+            sizes = [len(section) for section in self._sections]
+        else:
+            sizes = [len(self._words)] * int(self._args.combinations or 1)
+
+        self._unit_levels = 1
+        if combine and self._args.engine == self.ENGINE_PYTHON and not self._meet_split and len(sizes) >= 3:
+            self._unit_levels = 2
+        self._units = 1
+        for size in sizes[0:self._unit_levels]:
+            self._units *= size
+
+    # Targets may be split by context ("shards"), so words only match FNVs of the contexts they were read in
+    # (like event names vs "### EVENT NAMES") rather than all FNVs, for fewer fuzzy collisions and junk results.
+    # Words are still hashed once vs all FNVs (sharing hashes), and hits are checked vs the word's shard.
+    # Words without context (like most of ww.txt) use all FNVs.
+    def _get_shards(self):
+        specs = set(self._word_targets.get(word) for word in self._words)
+        specs.discard(None)
+
+        contexts = {}
+        for context, keys in self._contexts.items():
+            if context:
+                contexts.setdefault(context.lower(), set()).update(keys)
+
+        patterns = {} #pattern > FNVs of matching contexts
+        shards = {}
+        for spec in specs:
+            reversables = set()
+            for pattern in spec:
+                if pattern not in patterns:
+                    fnvs = contexts.get(pattern) #exact context (most common)
+                    if fnvs is None:
+                        fnvs = set()
+                        for context_lw in fnmatch.filter(contexts.keys(), pattern):
+                            fnvs.update(contexts[context_lw])
+                    patterns[pattern] = fnvs & self._reversables
+                reversables.update(patterns[pattern])
+
+            fuzzies = {}
+            for fnv in reversables:
+                fuzzies.setdefault(fnv & 0xFFFFFF00, []).append(fnv)
+            for fnv_fuzz, fnvs in fuzzies.items():
+                if len(fnvs) > 1: #same order as global FNVs
+                    fuzzies[fnv_fuzz] = [fnv for fnv in self._fuzzies[fnv_fuzz] if fnv in reversables]
+            shards[spec] = (reversables, fuzzies)
+
+        if shards:
+            sizes = [len(reversables) for reversables, _ in shards.values()]
+            print("using %i context shards (%i to %i FNVs)" % (len(sizes), min(sizes), max(sizes)))
+        return shards
+
+    # (reversables, fuzzies) of a word's shard (global if it has no contexts)
+    def _get_word_targets(self, word):
+        spec = self._word_targets.get(word)
+        if spec is None:
+            return (self._reversables, self._fuzzies)
+        return self._shards[spec]
+
+    # False if hit isn't part of a shard's FNVs
+    def _is_target_hit(self, targets, fnv, tail):
+        reversables, fuzzies = targets
+        if fnv in reversables:
+            return True
+        # fuzzy hits (not from exact suffixes or 2-letter tails)
+        return not self._args.fuzzy_disable and not tail and fnv & 0xFFFFFF00 in fuzzies
+
+    # Permutations can be reversed by splitting sections in half: hash (prefix + sections 1..k) forward and
+    # save those hashes, then unhash targets backwards through (sections k+1..n + suffix) and see if they
+    # match a saved hash. Rather than |S1|*|S2|*|S3|*|S4| hashes this needs ~|S1|*|S2| + |S3|*|S4|*|targets|,
+    # so it's only used when that is smaller (few targets, many sections).
+    def _get_meet_split(self, formats):
+        sizes = [len(section) for section in self._sections]
+        prefixes, _ = self._get_tree_formats(formats)
+        suffixes = set(full_format[4] for full_format in formats)
+        targets = len(self._reversables)
+
+        total = 1
+        for size in sizes:
+            total *= size
+        best_cost = total * len(formats)
+        best_split = 0
+
+        for split in range(1, len(sizes)):
+            left = 1
+            for size in sizes[:split]:
+                left *= size
+            right = total // left if left else 0
+            if left * len(prefixes) > self.MEET_LIMIT:
+                break
+
+            cost = left * len(prefixes) + right * targets * len(suffixes)
+            if cost * 2 < best_cost:
+                best_cost = cost
+                best_split = split
+
+        if best_split:
+            print("splitting sections 1..%i / %i..%i" % (best_split, best_split + 1, len(sizes)))
+        return best_split
+
+    # start/end: range of units to reverse
+    def _reverse_words_range(self, start, end):
+        combine = self._args.combinations or self._args.permutations
+        formats = self._get_formats(self._is_template_engine())
+
+        if self._gaps:
+            self._reverse_gaps(self._get_words_range(start, end))
+        elif self._args.engine == self.ENGINE_NUMPY:
+            self._reverse_words_numpy(self._get_words_range(start, end), formats)
+        elif self._meet_split:
+            self._reverse_meet(formats, start, end)
+        elif combine:
+            self._reverse_tree(formats, start, end)
+        else:
+            self._reverse_words(self._get_words_range(start, end), formats)
+
+    # lowercase words of a section that can be indexed (arenas are indexed directly, as a list of
+    # all words would use as much memory as a dict)
+    def _get_section_keys(self, section):
+        if isinstance(section, WordArena):
+            return section.keys()
+        return list(section.keys())
+
+    # returns (unit, word) in the same order as the regular iterators
+    def _get_words_range(self, start, end):
+        sections = [self._get_section_keys(section) for section in self._sections]
+
+        for i in range(start, end):
+            if self._args.permutations:
+                words = self._get_product(sections[0][i:i+1], sections[1:])
+            elif self._args.combinations:
+                combinations = int(self._args.combinations)
+                if self._args.combinations_unique:
+                    words = self._get_combinations_unique(sections[0], i, i + 1, combinations)
+                else:
+                    words = self._get_product(sections[0][i:i+1], [sections[0]] * (combinations - 1))
+            else:
+                words = sections[0][i:i+1]
+
+            for word in words:
+                yield i, word
+
+    # Gap formats have a gap of N '?' (bgm_%s_???) filled with 1..N chars, reversed by meeting in the middle:
+    # the side of the gap without the word is the same for all words, so it's done once (all targets unhashed
+    # through the suffix + last gap chars, or all hashes of the prefix + first gap chars), and per word only the
+    # other side + rest of the gap is hashed, doing one lookup per try.
+    def _get_gaps(self):
+        alphabet = bytes(dict.fromkeys(self._args.gap_alphabet.lower().encode('utf-8')))
+        reversables = self._reversables
+        self._gap_alphabet = alphabet
+
+        self._gap_trigrams = None
+        if self._args.gap_trigrams:
+            self._gap_trigrams = self._read_trigrams(self._args.gap_trigrams)
+
+        gaps = []
+        for format_og in self._args.gap_formats:
+            format_og = format_og.encode('utf-8')
+            format = format_og.lower()
+
+            start = format.find(b'?')
+            end = start
+            while end >= 0 and end < len(format) and format[end] == ord(b'?'):
+                end += 1
+            if start < 0 or b'?' in format[end:] or format.count(b'%') != 1 or format.count(b'%s') != 1:
+                print("ignored wrong gap format: %s" % (format_og))
+                continue
+            size = end - start
+
+            # name = text1 + word + text2 + gap + text3, or text1 + gap + text2 + word + text3
+            word_first = b'%s' in format[:start]
+            if word_first:
+                text1, text2 = format[:start].split(b'%s')
+                text3 = format[end:]
+                depth = self._get_gap_depth(len(alphabet), size, len(reversables))
+                tables = self._get_gap_tables_unhashed(alphabet, depth, text3)
+            else:
+                text1 = format[:start]
+                text2, text3 = format[end:].split(b'%s')
+                depth = self._get_gap_depth(len(alphabet), size, 1)
+                tables = self._get_gap_tables_hashed(alphabet, depth, text1)
+
+            gap = (format_og, start, end, word_first, text1, text2, text3, depth, tables)
+            gaps.append(gap)
+            print("prepared gap format %s (%i/%i chars saved)" % (format_og, depth, size))
+
+        return gaps
+
+    # max gap chars that can be saved in tables (the rest is tried per word)
+    def _get_gap_depth(self, chars, size, count):
+        depth = 0
+        total = count
+        while depth < size:
+            total += count * pow(chars, depth + 1)
+            if total > self.GAP_LIMIT:
+                break
+            depth += 1
+        return depth
+
+    # gap after word: tables of targets unhashed through (last N gap chars + suffix) = (FNV, gap chars), N = 0..depth
+    def _get_gap_tables_unhashed(self, alphabet, depth, text):
+        trigrams = self._gap_trigrams
+        prime_inv = self._fnv.FNV_PRIME_INV
+
+        level = [(self._fnv.get_unhash_nb(fnv, text), fnv, b'') for fnv in self._reversables]
+        tables = []
+        for i in range(depth + 1):
+            if i > 0:
+                items = []
+                for hash, fnv, chars in level:
+                    next = (chars + text)[0:2]
+                    for char in alphabet:
+                        # word is before gap, so chars can't be at start
+                        if trigrams and len(next) == 2 and bytes([char]) + next not in trigrams[1]:
+                            continue
+                        items.append( (((hash ^ char) * prime_inv) & 0xFFFFFFFF, fnv, bytes([char]) + chars) )
+                level = items
+
+            table = {}
+            for hash, fnv, chars in level:
+                table.setdefault(hash, []).append( (fnv, chars) )
+            tables.append(table)
+        return tables
+
+    # gap before word: tables of hashes of (prefix + first N gap chars) = gap chars, N = 0..depth
+    def _get_gap_tables_hashed(self, alphabet, depth, text):
+        level = [(self._fnv.get_hash_nb(text), b'')]
+        tables = []
+        for i in range(depth + 1):
+            if i > 0:
+                items = []
+                for hash, chars in level:
+                    for char in alphabet:
+                        if not self._is_gap_trigram(text + chars, char):
+                            continue
+                        items.append( (((hash * 16777619) ^ char) & 0xFFFFFFFF, chars + bytes([char])) )
+                level = items
+
+            table = {}
+            for hash, chars in level:
+                table.setdefault(hash, []).append(chars)
+            tables.append(table)
+        return tables
+
+    # trigram list: "abc: count" (anywhere) or "^abc: count" (at start)
+    # threshold: min count ("abc: 123") to use a trigram
+    def _read_trigrams(self, file, threshold=0):
+        starts = set()
+        middles = set()
+        try:
+            with open(file, 'rb') as infile:
+                for line in infile:
+                    line = line.strip()
+                    if not line or line.startswith(b'#'):
+                        continue
+                    trigram, _, count = line.partition(b':')
+                    trigram = trigram.strip()
+                    count = count.strip()
+                    if threshold and (not count.isdigit() or int(count) < threshold):
+                        continue
+                    if trigram.startswith(b'^'):
+                        starts.add(trigram[1:])
+                    else:
+                        middles.add(trigram)
+        except FileNotFoundError:
+            print("trigram list not found (%s)" % (file))
+            return None
+
+        print("loaded %i trigrams" % (len(starts) + len(middles)))
+        return starts, middles
+
+    # if char can be added after name, per trigrams
+    def _is_gap_trigram(self, name, char):
+        trigrams = self._gap_trigrams
+        if not trigrams or len(name) < 2:
+            return True
+        starts, middles = trigrams
+        trigram = name[-2:] + bytes([char])
+        if len(name) == 2:
+            return trigram in starts
+        return trigram in middles
+
+    # if all trigrams with gap chars (name[start:end]) are allowed
+    def _is_gap_allowed(self, name, start, end):
+        trigrams = self._gap_trigrams
+        if not trigrams:
+            return True
+        starts, middles = trigrams
+        for i in range(max(0, start - 2), min(end, len(name) - 2)):
+            trigram = name[i:i+3]
+            if trigram not in (starts if i == 0 else middles):
+                return False
+        return True
+
+    # Combos are pruned when trigrams where words are joined are uncommon: tail of previous word + joiner +
+    # start of next word ("xq" + "_zz" = "xq_", "q_z", "_zz"). Shared by all formats, as they're in the words.
+    def _is_combo_seam(self, seam):
+        trigrams = self._combo_trigrams
+        for i in range(len(seam) - 2):
+            if seam[i:i+3] not in trigrams:
+                return False
+        return True
+
+    # seam starts of next word (joiner + 2 chars) allowed after a previous word's tail
+    def _get_combo_heads(self, seams, tail):
+        _, heads, cache = seams
+        allowed = cache.get(tail)
+        if allowed is None:
+            allowed = set(head for head in heads if self._is_combo_seam(tail + head))
+            cache[tail] = allowed
+        return allowed
+
+    # same for a full combo (when not using the tree)
+    def _is_combo_allowed(self, words, joiner):
+        prev = words[0]
+        for word in words[1:]:
+            word = joiner + word
+            if not self._is_combo_seam(prev[-2:] + word[:len(joiner) + 2]):
+                return False
+            prev = word
+        return True
+
+    def _reverse_gaps(self, words):
+        reversables = self._reversables
+        gaps = self._gaps
+        prime_inv = self._fnv.FNV_PRIME_INV
+
+        # targets unhashed through suffix (gap before word)
+        unhashed = {}
+        for gap in gaps:
+            if not gap[3]:
+                unhashed[gap[6]] = [(self._fnv.get_unhash_nb(fnv, gap[6]), fnv) for fnv in reversables]
+
+        # info (jobs only print in the main process)
+        info_count = 0
+        info_add = max(1, 10000 // len(gaps)) if gaps else 1
+        info_top = info_add
+        if self._results is not None:
+            info_top = -1
+
+        for unit, word in words:
+            # quick ignore non-hashable
+            is_digit = 0x30 <= word[0] <= 0x39 #.isdigit()
+
+            for gap in gaps:
+                _, start, end, word_first, text1, text2, text3, _, _ = gap
+
+                if word_first:
+                    if not text1 and is_digit:
+                        continue
+                    text = text1 + word + text2
+                    hash = self._fnv.get_hash_nb(text)
+                    self._reverse_gap_hashed(gap, word, text, hash, b'')
+                else:
+                    text = text2 + word + text3
+                    for hash, fnv in unhashed[text3]:
+                        for namebyte in reversed(text2 + word):
+                            hash = ((hash ^ namebyte) * prime_inv) & 0xFFFFFFFF
+                        self._reverse_gap_unhashed(gap, word, text, hash, fnv, b'')
+
+            info_count += 1
+            if info_count == info_top:
+                info_top += info_add
+                self._print_progress(info_count, word)
+
+            self._checkpoint(unit + 1)
+
+    # gap after word: tries first gap chars (forward) + saved last chars
+    def _reverse_gap_hashed(self, gap, word, text, hash, chars):
+        _, start, end, _, _, _, _, depth, tables = gap
+        size = end - start
+        count = len(chars)
+
+        if count == 0:
+            for i in range(1, min(depth, size) + 1):
+                for fnv, last in tables[i].get(hash, []):
+                    self._write_gap(gap, word, fnv, last)
+        elif count + depth <= size:
+            for fnv, last in tables[depth].get(hash, []):
+                self._write_gap(gap, word, fnv, chars + last)
+
+        if count >= size - depth:
+            return
+        for char in self._gap_alphabet:
+            if not self._is_gap_trigram(text + chars, char):
+                continue
+            self._reverse_gap_hashed(gap, word, text, ((hash * 16777619) ^ char) & 0xFFFFFFFF, chars + bytes([char]))
+
+    # gap before word: tries last gap chars (backwards, from a target) + saved first chars
+    def _reverse_gap_unhashed(self, gap, word, text, hash, fnv, chars):
+        _, start, end, _, _, _, _, depth, tables = gap
+        size = end - start
+        count = len(chars)
+
+        if count == 0:
+            for i in range(1, min(depth, size) + 1):
+                for first in tables[i].get(hash, []):
+                    self._write_gap(gap, word, fnv, first)
+        elif count + depth <= size:
+            for first in tables[depth].get(hash, []):
+                self._write_gap(gap, word, fnv, first + chars)
+
+        if count >= size - depth:
+            return
+        prime_inv = self._fnv.FNV_PRIME_INV
+        for char in self._gap_alphabet:
+            self._reverse_gap_unhashed(gap, word, text, ((hash ^ char) * prime_inv) & 0xFFFFFFFF, fnv, bytes([char]) + chars)
+
+    def _write_gap(self, gap, word, fnv, chars):
+        format_og, start, end, word_first, text1, text2, text3, _, _ = gap
+
+        if word_first:
+            name = text1 + word + text2 + chars + text3
+            pos = len(text1 + word + text2)
+        else:
+            name = text1 + chars + text2 + word + text3
+            pos = len(text1)
+        if not self._is_gap_allowed(name, pos, pos + len(chars)):
+            return
+
+        self._stats.exact_hits += 1
+        format_og = format_og[:start] + chars + format_og[end:]
+        self._write_result(fnv, self._get_original_case(format_og, word, self._get_joiner()))
+
+    # Regular fuzzy matching only finds names with a different last letter ('bgm0' vs 'bgm9' FNVs only differ
+    # in the last byte). For 2 letters, all targets are "unhashed" through every 2 letter tail once, so names
+    # like 'bgm_ab' can be matched with 'bgm_cd' by looking up the hash before the tail ('bgm_'). Looking up the
+    # hash before the last letter or the full hash also matches 1-2 added letters ('bgm_01a', 'battles').
+    def _get_tails2(self):
+        chars = self._fnv.FNV_DICT
+        lasts = [(c2, [(c1, bytes([c1, c2])) for c1 in chars]) for c2 in chars]
+        prime_inv = self._fnv.FNV_PRIME_INV
+
+        tails2 = {}
+        for fnv in self._reversables:
+            for c2, firsts in lasts:
+                hash2 = ((fnv ^ c2) * prime_inv) & 0xFFFFFFFF
+                for c1, tail in firsts:
+                    hash1 = ((hash2 ^ c1) * prime_inv) & 0xFFFFFFFF
+                    tail_fnvs = tails2.get(hash1)
+                    if tail_fnvs is None:
+                        tail_fnvs = []
+                        tails2[hash1] = tail_fnvs
+                    tail_fnvs.append( (fnv, tail) )
+
+        print("prepared %i 2-letter fuzzy tails" % (len(tails2)))
+        return tails2
+
+    # Formats are grouped by prefix, and each group's suffixes are a trie ("%s" > "%s_" > "%s_bgm", "%s_music"),
+    # flattened as a list of nodes (parent, text, formats that end there) in tree order. This way words are
+    # hashed once per prefix, and shared parts of suffixes once per group.
+    def _get_format_groups(self, formats):
+        inverted = self._inverted
+
+        groups = {}
+        templates = []
+        for index, full_format in enumerate(formats):
+            _, _, type, pre, suf, pre_fnv = full_format
+
+            if type == self.FORMAT_TYPE_TEMPLATE:
+                templates.append( (index, full_format) )
+                continue
+
+            group = groups.get(pre)
+            if group is None:
+                group = (pre, pre_fnv, {}, [])
+                groups[pre] = group
+            _, _, root, unhashed = group
+
+            # exact suffixes can be unhashed once instead of hashed per word (see _prepare_reverse)
+            if suf and inverted:
+                unhashed.append( (index, full_format, inverted[suf]) )
+                continue
+
+            node = root
+            for namebyte in suf or b'':
+                node = node.setdefault(namebyte, {})
+            node.setdefault(None, []).append( (index, full_format) )
+
+        results = []
+        for pre, pre_fnv, root, unhashed in groups.values():
+            nodes = []
+            self._add_format_nodes(nodes, -1, b'', root)
+
+            # full text of each node's suffix
+            suffixes = []
+            for parent, text, _ in nodes:
+                suffixes.append(suffixes[parent] + text if parent >= 0 else text)
+
+            results.append( (pre or b'', pre_fnv, nodes, unhashed, suffixes) )
+        return results, templates
+
+    def _add_format_nodes(self, nodes, parent, text, node):
+        # nodes without formats and a single child are merged into one ("_" > "b" > "g" > "m" = "_bgm")
+        while parent >= 0 and len(node) == 1 and None not in node:
+            namebyte, node = next(iter(node.items()))
+            text += bytes([namebyte])
+
+        current = len(nodes)
+        nodes.append( (parent, text, node.get(None, [])) )
+        for namebyte, child in node.items():
+            if namebyte is None:
+                continue
+            self._add_format_nodes(nodes, current, bytes([namebyte]), child)
+
+    # Words are hashed in blocks sorted alphabetically, keeping a stack of FNV states per char (for all
+    # prefixes), so shared starts ("play", "play_stage", "play_stage_01") are only hashed once. Hits are
+    # written per block in the original word order.
+    def _reverse_words(self, words, formats):
+        no_fuzzy = self._args.fuzzy_disable
+        reversables = self._reversables
+        fuzzies = self._fuzzies
+        tails2 = self._tails2
+        shards = self._shards
+        groups, templates = self._get_format_groups(formats)
+        bases = [pre_fnv if pre else 2166136261 for pre, pre_fnv, _, _, _ in groups]
+
+        # info (jobs only print in the main process)
+        info_count = 0
+        info_add = max(1, 5000000 // self._get_formats_count(formats))
+        info_top = info_add
+        if self._results is not None:
+            info_top = -1
+
+        words = iter(words)
+        while True:
+            block = list(itertools.islice(words, self.WORDS_BLOCK))
+            if not block:
+                break
+
+            # hits are found per word and group, so they are sorted by word + format to write them in the usual order
+            hits = []
+
+            prev = b''
+            stack = [bases] #hash of prefix + first N chars of word, for each group
+            for pos in sorted(range(len(block)), key=lambda pos: block[pos][1]):
+                word = block[pos][1]
+
+                # quick ignore non-hashable
+                is_digit = 0x30 <= word[0] <= 0x39 #.isdigit()
+
+                # concats, slower (30-50%?)
+                #out = self._get_outword(full_format, word, joiner, combine)
+                # inline'd FNV hash, ~5% speedup
+                #fnv_base = self._fnv.get_hash_lw(out_lower)
+
+                #----------------------------------------------------------
+                # MAIN HASHING (inline'd)
+                #
+                # Instead of hash("base_aaa") we can avoid str concat by doing
+                # hash("base_"), hash("aaa") passing output as next seed.
+                # words are pre-converted to bytes for a minor speed up too.
+                # Chars shared with the previous word reuse its states.
+                same = 0
+                size = min(len(prev), len(word))
+                while same < size and prev[same] == word[same]:
+                    same += 1
+                del stack[same + 1:]
+
+                for namebyte in word[same:]:
+                    stack.append([((hash * 16777619) ^ namebyte) & 0xFFFFFFFF for hash in stack[-1]])
+                prev = word
+                hashes = stack[-1]
+
+                for (pre, pre_fnv, nodes, unhashed, suffixes), hash in zip(groups, hashes):
+                    if not pre and is_digit:
+                        continue
+
+                    for index, full_format, suffix_inverted in unhashed:
+                        fnv = suffix_inverted.get(hash)
+                        if fnv is not None:
+                            hits.append( (pos, index, full_format, fnv, None) )
+
+                    # suffixes continue from their parent's hash (root = prefix + word)
+                    states = []
+                    for parent, text, ends in nodes:
+                        if parent >= 0:
+                            hash = states[parent]
+                            for namebyte in text:
+                                hash = ((hash * 16777619) ^ namebyte) & 0xFFFFFFFF
+                        states.append(hash)
+
+                        if not ends:
+                            continue
+
+                        #----------------------------------------------------------
+
+                        # its ~2-5% faster calc FNV + check if it a target FNV, than checking for skips first (less common)
+                        # non-empty test first = minor speedup if file doesn't exist
+                        #if self._skips and out in self._skips:
+                        #    continue
+
+                        if tails2 is not None:
+                            self._find_tails2(hits, pos, ends, hash, pre + word + suffixes[len(states) - 1])
+
+                        if no_fuzzy and hash not in reversables:
+                            continue
+
+                        fnv_fuzz = hash & 0xFFFFFF00
+                        if fnv_fuzz in fuzzies:
+                            for index, full_format in ends:
+                                hits.append( (pos, index, full_format, hash, None) )
+
+                if templates:
+                    template_hits = []
+                    for index, full_format in templates:
+                        self._reverse_template(full_format[3], word, is_digit, template_hits, index)
+                    hits += [(pos, index, full_format, fnv, None) for index, full_format, fnv in template_hits]
+
+            if hits:
+                hits.sort(key=lambda hit: (hit[0], hit[1])) #stable, so templates keep their order
+                for pos, _, full_format, fnv, tail in hits:
+                    targets = None
+                    if shards:
+                        targets = self._get_word_targets(block[pos][1])
+                        if not self._is_target_hit(targets, fnv, tail):
+                            continue
+                    if tail:
+                        self._write_match_tail2(full_format, block[pos][1], fnv, tail)
+                    else:
+                        self._write_match(full_format, block[pos][1], fnv, targets)
+
+            for unit, word in block:
+                info_count += 1
+                if info_count == info_top:
+                    info_top += info_add
+                    self._print_progress(info_count, word)
+
+            self._checkpoint(block[-1][0] + 1)
+
+    # adds FNVs that match the name with other last 2 letters, or with 1-2 letters added/changed at the end
+    # (see _get_tails2), as (chars to cut from the name, tail)
+    def _find_tails2(self, hits, pos, ends, hash, name):
+        tails2 = self._tails2
+        last = name[-2:]
+        for cut in range(len(last) + 1):
+            if cut:
+                hash = ((hash ^ last[-cut]) * self._fnv.FNV_PRIME_INV) & 0xFFFFFFFF
+
+            for fnv, tail in tails2.get(hash, []):
+                if cut == 2 and tail == last: #regular match
+                    continue
+                for index, full_format in ends:
+                    hits.append( (pos, index, full_format, fnv, (cut, tail)) )
+
+    # Templates are expanded per word as a tree of parts ("blah_" > "blah_0" > "blah_01" > "blah_01_" > word > ...),
+    # so shared parts are hashed once. Hits are found in the same order as expanding all formats first.
+    def _reverse_template(self, template, word, is_digit, hits, index):
+        _, word_part, pfs, _, _, _, _ = template
+
+        states = []
+        for pf, _, pf_fnv in pfs:
+            # quick ignore non-hashable (no prefix + first word is a number)
+            if not pf and not word_part and is_digit:
+                states.append(None)
+            else:
+                states.append(pf_fnv)
+        if not any(hash is not None for hash in states):
+            return
+
+        self._reverse_template_part(template, word, 0, states, [], hits, index)
+
+    def _reverse_template_part(self, template, word, level, states, path, hits, index):
+        parts, word_part, pfs, variants, _, _, tails = template
+
+        last = len(parts) - 1
+        if tails is not None:
+            last = word_part
+
+        options = self._get_template_options(parts[level], word)
+        if level < last:
+            for value, value_og in options:
+                next_states = []
+                for hash in states:
+                    if hash is not None:
+                        for namebyte in value:
+                            hash = ((hash * 16777619) ^ namebyte) & 0xFFFFFFFF
+                    next_states.append(hash)
+
+                path.append(value_og)
+                self._reverse_template_part(template, word, level + 1, next_states, path, hits, index)
+                path.pop()
+            return
+
+        # last part: most nodes are here, so suffixes are checked directly
+        no_fuzzy = self._args.fuzzy_disable
+        reversables = self._reversables
+        fuzzies = self._fuzzies
+        inverted = self._inverted
+
+        if tails is None:
+            # big parts (tails not precalculated) are made per word as needed
+            tails = ((pf_index, value + sf, value_og + sf_og) for value, value_og in options for pf_index, sf, sf_og in variants)
+            inverted = None
+        else:
+            next_states = []
+            for hash in states:
+                if hash is not None:
+                    for namebyte in word:
+                        hash = ((hash * 16777619) ^ namebyte) & 0xFFFFFFFF
+                next_states.append(hash)
+            states = next_states
+            path = path + [b'%s']
+
+        for pf_index, tail, tail_og in tails:
+            hash = states[pf_index]
+            if hash is None:
+                continue
+
+            if tail and inverted:
+                fnv = inverted[tail].get(hash)
+                if fnv is not None:
+                    format = pfs[pf_index][1] + b''.join(path) + tail_og
+                    hits.append( (index, self._get_format_tuple(format), fnv) )
+                continue
+
+            for namebyte in tail:
+                hash = ((hash * 16777619) ^ namebyte) & 0xFFFFFFFF
+
+            if no_fuzzy and hash not in reversables:
+                continue
+            if hash & 0xFFFFFF00 in fuzzies:
+                format = pfs[pf_index][1] + b''.join(path) + tail_og
+                hits.append( (index, self._get_format_tuple(format), hash) )
+
+    # Combinations/permutations are reversed as a tree, where each level adds one word to the combo
+    # ("pre_aaa" > "pre_aaa_bbb" > "pre_aaa_bbb_ccc" ...), carrying the FNV state of each format prefix.
+    # This way "pre_aaa_" is hashed once rather than once per combo that starts with it.
+    # With multiple joiners the first word's states are shared, and each joiner is a separate tree from there.
+    def _reverse_tree(self, formats, start, end):
+        joiners = self._get_joiners()
+        levels, _, unique = self._get_tree_levels()
+        if not levels or not all(levels):
+            return
+        prefixes, tree_formats = self._get_tree_formats(formats)
+
+        max_chars = self._args.max_chars
+        min_format = min(len(full_format[1]) - 2 for full_format in formats) #without '%s'
+
+        trees = []
+        for joiner in joiners:
+            _, tree_words, _ = self._get_tree_levels(joiner)
+
+            # minimum chars added by each level and formats, to ignore combos that can't fit
+            min_chars = [0] * len(levels)
+            for level in range(len(levels) - 2, -1, -1):
+                min_chars[level] = min_chars[level + 1] + min(len(word) for word in tree_words[level + 1])
+
+            # seam start of words after the first (see _is_combo_seam)
+            seams = None
+            if self._combo_trigrams:
+                head_len = len(joiner) + 2
+                heads = set(word[:head_len] for words in tree_words[1:] for word in words)
+                seams = (head_len, heads, {})
+
+            trees.append( (levels, tree_words, tree_formats, unique, max_chars, min_chars, min_format, seams) )
+        tree_words = trees[0][1]
+
+        # units may be first words (start..end) or first + second words (start // N .. end // N)
+        units_size = None
+        first = start
+        last = end
+        if self._unit_levels == 2:
+            units_size = len(levels[1])
+            first = start // units_size
+            last = -(-end // units_size)
+
+        states = [pre_fnv if pre else 2166136261 for pre, pre_fnv in prefixes]
+
+        # info (jobs only print in the main process)
+        info_count = 0
+        info_add = max(1, 5000000 // len(formats))
+        info_top = info_add
+        info_leaves = len(joiners)
+        for words in levels[1:]:
+            info_leaves *= len(words)
+
+        for i in range(first, last):
+            word = tree_words[0][i]
+
+            # quick ignore non-hashable (no prefix + first word is a number)
+            is_digit = 0x30 <= word[0] <= 0x39 #.isdigit()
+
+            next_states = []
+            for (pre, _), hash in zip(prefixes, states):
+                if not pre and is_digit:
+                    next_states.append(None)
+                    continue
+                for namebyte in word:
+                    hash = ((hash * 16777619) ^ namebyte) & 0xFFFFFFFF
+                next_states.append(hash)
+
+            if not any(hash is not None for hash in next_states):
+                continue
+
+            if len(levels) == 1:
+                self._reverse_tree_leaf(trees[0], next_states, [i])
+            elif units_size:
+                # all joiners per unit, to resume from any unit
+                lo = max(start - i * units_size, 0)
+                hi = min(end - i * units_size, units_size)
+                for k in range(lo, hi):
+                    for joiner, tree in zip(joiners, trees):
+                        self._reverse_tree_first(tree, joiner, next_states, i, word, (k, k + 1))
+                    self._checkpoint(i * units_size + k + 1)
+            else:
+                for joiner, tree in zip(joiners, trees):
+                    self._reverse_tree_first(tree, joiner, next_states, i, word)
+            self._joiner = None
+
+            if not units_size:
+                self._checkpoint(i + 1)
+
+            info_count += info_leaves
+            if info_count >= info_top and self._results is None:
+                info_top = info_count + info_add
+                self._print_progress(info_count, word)
+
+    def _reverse_tree_first(self, tree, joiner, states, i, word, units=None):
+        _, _, _, _, max_chars, min_chars, min_format, _ = tree
+        if max_chars and len(word) + min_chars[0] + min_format > max_chars:
+            return
+        self._joiner = joiner
+        self._reverse_tree_level(tree, 1, states, [i], len(word), units)
+
+    # units: range of words in this level (when using first + second word as units)
+    def _reverse_tree_level(self, tree, level, states, path, length, units=None):
+        levels, tree_words, tree_formats, unique, max_chars, min_chars, min_format, seams = tree
+        words = tree_words[level]
+        is_last = level + 1 == len(levels)
+
+        head_len = None
+        if seams:
+            head_len = seams[0]
+            allowed = self._get_combo_heads(seams, tree_words[level - 1][path[-1]][-2:])
+
+        if not is_last:
+            lo, hi = units or (0, len(words))
+            for i in range(lo, hi):
+                word = words[i]
+                if unique and i in path:
+                    continue
+                if head_len and word[:head_len] not in allowed:
+                    continue
+                next_length = length + len(word)
+                if max_chars and next_length + min_chars[level] + min_format > max_chars:
+                    continue
+
+                next_states = []
+                for hash in states:
+                    if hash is not None:
+                        for namebyte in word:
+                            hash = ((hash * 16777619) ^ namebyte) & 0xFFFFFFFF
+                    next_states.append(hash)
+
+                self._reverse_tree_level(tree, level + 1, next_states, path + [i], next_length)
+            return
+
+        # last level
+        for i, word in enumerate(words):
+            if unique and i in path:
+                continue
+            if head_len and word[:head_len] not in allowed:
+                continue
+            if max_chars and length + len(word) + min_format > max_chars:
+                continue
+
+            next_states = []
+            for hash in states:
+                if hash is not None:
+                    for namebyte in word:
+                        hash = ((hash * 16777619) ^ namebyte) & 0xFFFFFFFF
+                next_states.append(hash)
+
+            self._reverse_tree_leaf(tree, next_states, path + [i])
+
+    # same as _reverse_words but from the combo's states
+    def _reverse_tree_leaf(self, tree, states, path):
+        levels, _, tree_formats, _, _, _, _, _ = tree
+        no_fuzzy = self._args.fuzzy_disable
+        reversables = self._reversables
+        fuzzies = self._fuzzies
+        inverted = self._inverted
+
+        for full_format, index, suf in tree_formats:
+            hash = states[index]
+            if hash is None:
+                continue
+
+            if suf:
+                if inverted:
+                    fnv = inverted[suf].get(hash)
+                    if fnv is not None:
+                        self._write_match(full_format, self._get_tree_word(levels, path), fnv)
+                    continue
+
+                for namebyte in suf:
+                    hash = ((hash * 16777619) ^ namebyte) & 0xFFFFFFFF
+
+            fnv_base = hash
+
+            if no_fuzzy and fnv_base not in reversables:
+                continue
+
+            fnv_fuzz = fnv_base & 0xFFFFFF00
+            if fnv_fuzz in fuzzies:
+                self._write_match(full_format, self._get_tree_word(levels, path), fnv_base)
+
+    def _get_tree_word(self, levels, path):
+        return tuple(levels[level][i] for level, i in enumerate(path))
+
+    def _get_tree_levels(self, joiner=None):
+        if joiner is None:
+            joiner = self._get_joiner()
+
+        if self._args.permutations:
+            levels = [self._get_section_keys(section) for section in self._sections]
+            unique = False
+        else:
+            levels = [self._get_section_keys(self._words)] * int(self._args.combinations)
+            unique = self._args.combinations_unique
+
+        # words after the first one are hashed with the joiner
+        tree_words = levels[0:1]
+        for words in levels[1:]:
+            if isinstance(words, WordArenaView):
+                tree_words.append(words.joined(joiner))
+            else:
+                tree_words.append([joiner + word for word in words])
+
+        return levels, tree_words, unique
+
+    # formats with the same prefix share states
+    def _get_tree_formats(self, formats):
+        prefixes = []
+        tree_formats = []
+        for full_format in formats:
+            pre, suf, pre_fnv = full_format[3], full_format[4], full_format[5]
+            for index, prefix in enumerate(prefixes):
+                if prefix[0] == pre:
+                    break
+            else:
+                index = len(prefixes)
+                prefixes.append( (pre, pre_fnv) )
+            tree_formats.append( (full_format, index, suf) )
+        return prefixes, tree_formats
+
+    # See _get_meet_split. Results are sorted at the end to write them in the same order as the tree.
+    def _reverse_meet(self, formats, start, end):
+        for joiner in self._get_joiners():
+            self._joiner = joiner
+            self._reverse_meet_joiner(formats, start, end, joiner)
+        self._joiner = None
+
+        self._checkpoint(end)
+
+    def _reverse_meet_joiner(self, formats, start, end, joiner):
+        levels, tree_words, _ = self._get_tree_levels(joiner)
+        if not all(levels):
+            return
+        prefixes, tree_formats = self._get_tree_formats(formats)
+        split = self._meet_split
+
+        # left: forward hashes of prefix + sections 1..k (per prefix)
+        tables = [{} for _ in prefixes]
+        states = [pre_fnv if pre else 2166136261 for pre, pre_fnv in prefixes]
+        for i in range(start, end):
+            word = tree_words[0][i]
+
+            # quick ignore non-hashable (no prefix + first word is a number)
+            is_digit = 0x30 <= word[0] <= 0x39 #.isdigit()
+
+            next_states = []
+            for (pre, _), hash in zip(prefixes, states):
+                if not pre and is_digit:
+                    next_states.append(None)
+                    continue
+                for namebyte in word:
+                    hash = ((hash * 16777619) ^ namebyte) & 0xFFFFFFFF
+                next_states.append(hash)
+
+            self._reverse_meet_left(tree_words, split, 1, next_states, (i,), tables)
+
+        # right: targets unhashed through suffix + sections n..k+1, per suffix
+        suffixes = {}
+        for f, (full_format, index, suf) in enumerate(tree_formats):
+            if suf not in suffixes:
+                suffixes[suf] = []
+            suffixes[suf].append( (f, index) )
+
+        hits = []
+        for suf, suffix_formats in suffixes.items():
+            if suf:
+                targets = [(self._fnv.get_unhash_nb(fnv, suf), fnv) for fnv in self._reversables]
+            else:
+                targets = [(fnv, fnv) for fnv in self._reversables]
+            meet = (tree_words, split, tables, suffix_formats, hits)
+            self._reverse_meet_right(meet, len(levels) - 1, targets, ())
+
+        hits.sort()
+        for path, f, fnv in hits:
+            full_format = tree_formats[f][0]
+            word = self._get_tree_word(levels, path)
+            if self._combo_trigrams and not self._is_combo_allowed(word, joiner):
+                continue
+            self._write_match(full_format, word, fnv)
+
+    def _reverse_meet_left(self, tree_words, split, level, states, path, tables):
+        if level == split:
+            for table, hash in zip(tables, states):
+                if hash is None:
+                    continue
+                paths = table.get(hash)
+                if paths is None:
+                    table[hash] = [path]
+                else:
+                    paths.append(path)
+            return
+
+        for i, word in enumerate(tree_words[level]):
+            next_states = []
+            for hash in states:
+                if hash is not None:
+                    for namebyte in word:
+                        hash = ((hash * 16777619) ^ namebyte) & 0xFFFFFFFF
+                next_states.append(hash)
+
+            self._reverse_meet_left(tree_words, split, level + 1, next_states, path + (i,), tables)
+
+    def _reverse_meet_right(self, meet, level, targets, path):
+        tree_words, split, tables, suffix_formats, hits = meet
+        prime_inv = self._fnv.FNV_PRIME_INV
+
+        for i, word in enumerate(tree_words[level]):
+            word_rev = word[::-1]
+            next_targets = []
+            for hash, fnv in targets:
+                for namebyte in word_rev:
+                    hash = ((hash ^ namebyte) * prime_inv) & 0xFFFFFFFF #FNV inverse
+                next_targets.append( (hash, fnv) )
+
+            if level > split:
+                self._reverse_meet_right(meet, level - 1, next_targets, (i,) + path)
+                continue
+
+            # join with left hashes
+            for hash, fnv in next_targets:
+                for f, index in suffix_formats:
+                    paths = tables[index].get(hash)
+                    if not paths:
+                        continue
+                    for left_path in paths:
+                        hits.append( (left_path + (i,) + path, f, fnv) )
+
+    # Same as the above but hashes words in batches with numpy (uint32 math wraps around like FNV's).
+    # Words are packed into (words x chars) matrices of the same length, and each format hashes
+    # all rows at once, column by column. Hits are written in the same order as the python engine.
+    def _reverse_words_numpy(self, words, formats):
+        no_fuzzy = self._args.fuzzy_disable
+
+        joiners = self._get_joiners()
+        combine = self._args.combinations or self._args.permutations
+        if not combine:
+            joiners = joiners[0:1]
+
+        if no_fuzzy:
+            targets = numpy.array(sorted(self._reversables), dtype=numpy.uint32)
+        else:
+            targets = numpy.array(sorted(self._fuzzies), dtype=numpy.uint32)
+        formats = list(formats)
+
+        info_count = 0
+        chunk = []
+        for unit, word in words:
+            chunk.append(word)
+            if len(chunk) < self.NUMPY_CHUNK:
+                continue
+            for joiner in joiners:
+                self._joiner = joiner
+                self._reverse_chunk_numpy(chunk, formats, targets, joiner, combine)
+            self._joiner = None
+            info_count += len(chunk)
+            if self._results is None:
+                self._print_progress(info_count, word)
+            chunk = []
+
+            # current unit may not be finished (resuming retries it, and already written results are skipped)
+            self._checkpoint(unit)
+
+        if chunk:
+            for joiner in joiners:
+                self._joiner = joiner
+                self._reverse_chunk_numpy(chunk, formats, targets, joiner, combine)
+            self._joiner = None
+
+    def _reverse_chunk_numpy(self, chunk, formats, targets, joiner, combine):
+        no_fuzzy = self._args.fuzzy_disable
+        prime = numpy.uint32(16777619)
+
+        if combine:
+            names = [joiner.join(word) for word in chunk]
+        else:
+            names = chunk
+
+        lengths = {}
+        for i, name in enumerate(names):
+            if combine and self._combo_trigrams and not self._is_combo_allowed(chunk[i], joiner):
+                continue
+            lengths.setdefault(len(name), []).append(i)
+
+        hits = []
+        for length, indexes in lengths.items():
+            indexes = numpy.array(indexes)
+            matrix = numpy.frombuffer(b''.join([names[i] for i in indexes]), dtype=numpy.uint8)
+            matrix = matrix.reshape(len(indexes), length)
+            columns = [matrix[:, col] for col in range(length)]
+
+            # quick ignore non-hashable
+            is_digit = (columns[0] >= 0x30) & (columns[0] <= 0x39)
+
+            for f, full_format in enumerate(formats):
+                format, _, type, pre, suf, pre_fnv = full_format
+
+                hash = numpy.full(len(indexes), pre_fnv if pre else 2166136261, dtype=numpy.uint32)
+                for column in columns:
+                    hash = (hash * prime) ^ column
+                if suf:
+                    for namebyte in suf:
+                        hash = (hash * prime) ^ numpy.uint32(namebyte)
+
+                if no_fuzzy:
+                    found = self._contains_numpy(targets, hash)
+                else:
+                    found = self._contains_numpy(targets, hash & numpy.uint32(0xFFFFFF00))
+                if not pre:
+                    found &= ~is_digit
+
+                for pos in numpy.flatnonzero(found):
+                    hits.append( (int(indexes[pos]), f, int(hash[pos])) )
+
+        hits.sort()
+        for i, f, fnv_base in hits:
+            self._write_match(formats[f], chunk[i], fnv_base)
+
+    def _contains_numpy(self, targets, values):
+        if not len(targets):
+            return numpy.zeros(len(values), dtype=bool)
+        pos = numpy.searchsorted(targets, values)
+        pos[pos == len(targets)] = 0
+        return targets[pos] == values
+
+    # writes all IDs that match the hashed word (exact or fuzzy)
+    # targets: (reversables, fuzzies) of the word's shard (global if not set)
+    def _write_match(self, full_format, word, fnv_base, targets=None):
+        format_og = full_format[1]
+        joiner = self._get_joiner()
+        reversables, fuzzies = targets or (self._reversables, self._fuzzies)
+
+        if fnv_base in reversables:
+            self._stats.exact_hits += 1
+
+        if self._args.fuzzy_disable:
+            # regular match
+            fnvs = [fnv_base]
+        else:
+            # multiple fnv may use the same fuzz
+            fnvs = fuzzies.get(fnv_base & 0xFFFFFF00, [])
+            self._stats.fuzzy_hits += 1
+
+        out_base = self._get_original_case(format_og, word, joiner)
+        basehash = None
+        for fnv in fnvs:
+            out_final = out_base
+            if fnv != fnv_base:
+                # hash up to last byte can be derived from the final hash
+                if basehash is None:
+                    basehash = self._fnv.get_unhash_nb(fnv_base, out_base[-1:].lower())
+                out_final = self._fnv.unfuzzy_hashname_hash(fnv, basehash, out_base)
+                if not out_final: #may happen in rare cases
+                    continue
+
+            self._write_result(fnv, out_final)
+
+    # writes an ID that matches the hashed word with other last 2 letters
+    def _write_match_tail2(self, full_format, word, fnv, tail):
+        self._stats.fuzzy_hits += 1
+
+        cut, tail = tail
+        out_base = self._get_original_case(full_format[1], word, self._get_joiner())
+        if out_base.isupper(): #upper only if all base name is upper
+            tail = tail.upper()
+        self._write_result(fnv, out_base[:len(out_base) - cut] + tail)
+
+    # joiner: joiner that made the result (when trying multiple joiners)
+    def _write_result(self, fnv, out_final, joiner=None):
+        if joiner is None:
+            joiner = self._joiner
+
+        # jobs can't write (nor know skips from other jobs), so results are passed to the main process in order
+        if self._results is not None:
+            self._results.append( (fnv, out_final, joiner) )
+            return
+
+        out_final_lw = out_final.lower()
+        if out_final_lw in self._skips:
+            return
+        if self._skips_store and out_final_lw in self._skips_store:
+            return
+        self._skips.add(out_final_lw)
+
+        # don't print non-useful hashes
+        if not self._fnv.is_hashable(out_final_lw):
+            return
+        if self._args.max_chars and len(out_final) > self._args.max_chars:
+            return
+
+        if self._skips_store:
+            self._skips_store.add(out_final_lw)
+            skip_line = None
+        else:
+            skip_line = "%s: %s\n" % (fnv, str(out_final_lw, 'utf-8'))
+
+        batches = None
+        if self._batch_targets:
+            batches = self._batch_targets.get(fnv)
+
+        out_final = str(out_final, 'utf-8')
+        self._writer.write("%s: %s\n" % (fnv, out_final), skip_line, batches)
+
+        self._written += 1
+        if joiner is not None and self._args.joiners: #only reported when trying multiple joiners
+            self._stats.add_joiner(joiner)
+
+    # Splits words in shards of the first word (base word, first combo word or first section word),
+    # that are reversed in separate processes. Results are written in shard order, so output is
+    # the same as when using a single process.
+    def _reverse_words_jobs(self, unit=0):
+        units = self._units
+        shards = self._args.jobs * self.JOBS_SHARDS
+        if self._meet_split:
+            shards = self._args.jobs #each shard must unhash all targets
+        shard_len = max(1, -(-(units - unit) // shards))
+        shards = [(start, min(start + shard_len, units)) for start in range(unit, units, shard_len)]
+
+        print("using %i jobs (%i shards)" % (self._args.jobs, len(shards)))
+        total = self._words_total
+        with multiprocessing.Pool(self._args.jobs, _init_job, (self,)) as pool:
+            for (start, end), (results, fuzzy_hits, exact_hits) in zip(shards, pool.imap(_run_job, shards)):
+                for fnv, out_final, joiner in results:
+                    self._write_result(fnv, out_final, joiner)
+                self._stats.fuzzy_hits += fuzzy_hits
+                self._stats.exact_hits += exact_hits
+                self._stats.update(total * end // units - total * unit // units, self._written)
+                print("%i/%i..." % (end, units), self._stats.get_info())
+                self._checkpoint(end)
+
+    def _reverse_words_shard(self, start, end):
+        self._results = []
+        self._stats.fuzzy_hits = 0
+        self._stats.exact_hits = 0
+        self._reverse_words_range(start, end)
+        return self._results, self._stats.fuzzy_hits, self._stats.exact_hits
+
+    # same as itertools.permutations(words, r) but only for first words in start..end
+    # itertools.product/permutations make a tuple of their inputs, so arenas are combined by index
+    # (otherwise every word would be made at once)
+    def _get_product(self, firsts, sections):
+        if not any(isinstance(section, WordArenaView) for section in sections):
+            return itertools.product(firsts, *sections)
+        ranges = [range(len(section)) for section in sections]
+        return (
+            (first,) + tuple(section[index] for section, index in zip(sections, item))
+            for first in firsts for item in itertools.product(*ranges)
+        )
+
+    def _get_combinations_unique(self, words, start, end, combinations):
+        for i in range(start, end):
+            if isinstance(words, WordArenaView):
+                others = itertools.chain(range(i), range(i + 1, len(words)))
+                for item in itertools.permutations(others, combinations - 1):
+                    yield (words[i],) + tuple(words[index] for index in item)
+                continue
+            others = words[:i] + words[i+1:]
+            for item in itertools.permutations(others, combinations - 1):
+                yield (words[i],) + item
+
+    # count: words/combos done in current range
+    def _print_progress(self, count, word):
+        self._stats.update(count, self._written)
+        print("%i..." % (count), word, self._stats.get_info())
+
+    #--------------------------------------------------------------------------
+
+    # cache file for current files (by contents) and flags, None if not using cache
+    def _get_cache_file(self, wwnames_files, input_files):
+        if not self._args.cache_dir:
+            return None
+
+        digest = hashlib.sha1()
+        config = {key: value for key, value in vars(self._args).items() if key not in self.CACHE_IGNORED_ARGS}
+        digest.update(repr( (self.CACHE_VERSION, sorted(config.items())) ).encode('utf-8'))
+
+        files = [self._args.formats_file] + wwnames_files + [b'#@input'] + input_files + [b'#@reverse', self._args.reverse_file]
+        for file in files:
+            if isinstance(file, bytes):
+                digest.update(file)
+                continue
+            digest.update(file.encode('utf-8', errors='replace') + b'\n')
+            try:
+                with open(file, 'rb') as infile:
+                    for chunk in iter(lambda: infile.read(0x100000), b''):
+                        digest.update(chunk)
+            except FileNotFoundError:
+                digest.update(b'#@missing')
+            digest.update(b'\n')
+
+        return os.path.join(self._args.cache_dir, self.FILENAME_CACHE_EX % (digest.hexdigest()))
+
+    def _load_cache(self, file):
+        if not file:
+            return False
+        try:
+            with open(file, 'rb') as infile:
+                cache = pickle.load(infile)
+        except FileNotFoundError:
+            return False
+
+        self._formats = cache['formats']
+        self._sections = cache['sections']
+        self._words = self._sections[-1]
+        self._section = len(self._sections) - 1
+        self._skips = cache['skips']
+        self._reversables = cache['reversables']
+        self._fuzzies = cache['fuzzies']
+        self._contexts = cache['contexts']
+        self._word_targets = cache['word_targets']
+        self._batch = cache['batch']
+        self._args.fuzzy_disable, self._args.format_auto = cache['flags']
+
+        print("loaded cache %s" % (file))
+        return True
+
+    def _save_cache(self, file):
+        if not file:
+            return
+
+        cache = {
+            'formats': self._formats,
+            'sections': self._sections,
+            'skips': self._skips,
+            'reversables': self._reversables,
+            'fuzzies': self._fuzzies,
+            'contexts': self._contexts,
+            'word_targets': self._word_targets,
+            'batch': self._batch,
+            'flags': (self._args.fuzzy_disable, self._args.format_auto),
+        }
+
+        os.makedirs(self._args.cache_dir, exist_ok=True)
+        with open(file + '.tmp', 'wb') as outfile:
+            pickle.dump(cache, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(file + '.tmp', file)
+        print("saved cache %s" % (file))
+
+    #--------------------------------------------------------------------------
+
+    def _get_checkpoint_file(self):
+        return self.FILENAME_CHECKPOINT_EX % (self._args.output_file)
+
+    # identifies inputs, so a checkpoint isn't used with different files/flags
+    def _get_digest(self):
+        if self._digest:
+            return self._digest
+
+        args = self._args
+        # engine changes how words are split in units (python is used if numpy isn't installed)
+        engine = args.engine if numpy else self.ENGINE_PYTHON
+        digest = hashlib.sha1()
+        config = [args.combinations, args.combinations_unique, args.permutations, args.fuzzy_disable, args.fuzzy_tail2, args.max_chars, self._get_joiners(),
+            args.context_shards, args.gap_formats, args.gap_alphabet, args.gap_trigrams,
+            args.combo_trigrams, args.combo_trigrams_min, args.reverse_batch, engine]
+        digest.update(repr(config).encode('utf-8'))
+        for section in self._sections:
+            for i, word in enumerate(section.keys()): #same as b'\n'.join(...) without making it
+                if i:
+                    digest.update(b'\n')
+                digest.update(word)
+            digest.update(b'\n#@section\n')
+        for format in self._formats.keys():
+            digest.update(format + b'\n')
+        for fnv in sorted(self._reversables):
+            digest.update(b'%i\n' % (fnv))
+
+        self._digest = digest.hexdigest()
+        return self._digest
+
+    # Saves current position every now and then, so it can be resumed. Units before 'unit' must be done,
+    # and (flushed) results up to this point can't include those of later units.
+    def _checkpoint(self, unit):
+        if not self._checkpoint_time or self._results is not None:
+            return
+        if time.time() < self._checkpoint_time:
+            return
+
+        out_offset, skip_offset, batch_offsets = self._writer.sync()
+        if self._skips_store:
+            skip_offset = self._skips_store.sync()
+
+        checkpoint = {
+            'digest': self._get_digest(),
+            'units': self._units,
+            'unit': unit,
+            'written': self._written,
+            'output': out_offset,
+            'skips': skip_offset,
+            'batches': batch_offsets,
+        }
+
+        file = self._get_checkpoint_file()
+        with open(file + '.tmp', 'w') as outfile:
+            json.dump(checkpoint, outfile)
+        os.replace(file + '.tmp', file)
+
+        self._checkpoint_time = time.time() + self._args.checkpoint_interval
+
+    # Loads checkpoint and removes results written after it (before reading skips)
+    def _load_checkpoint(self):
+        if not self._args.resume:
+            return True
+
+        file = self._get_checkpoint_file()
+        try:
+            with open(file, 'r') as infile:
+                checkpoint = json.load(infile)
+        except FileNotFoundError:
+            print("checkpoint %s not found" % (file))
+            return False
+
+        if checkpoint['digest'] != self._get_digest():
+            print("checkpoint doesn't match current words/formats/FNVs/flags")
+            return False
+
+        try:
+            os.truncate(self._args.output_file, checkpoint['output'])
+            if self._args.skips_store:
+                os.truncate(self._args.skips_store + '.log', checkpoint['skips'])
+            else:
+                os.truncate(self._args.skips_file, checkpoint['skips'])
+            for (file, _), offset in zip(self._batch or [], checkpoint.get('batches', [])):
+                os.truncate(self._get_batch_file(file), offset)
+        except FileNotFoundError as e:
+            print("checkpoint file %s not found" % (e.filename))
+            return False
+
+        self._resume = checkpoint
+        return True
+
+    #--------------------------------------------------------------------------
+
+    def _get_outword(self, full_format, word, joiner, combine):
+        format, _, type, pre, suf, _ = full_format    
+
+        #if pre:
+        #    pre = pre.decode("utf-8")
+        #if suf:
+        #    suf = suf.decode("utf-8")
+
+        if combine:
+            baseword = joiner.join(word)
+        else:
+            baseword = word
+
+        # doing "str % (str)" every time is ~40% slower
+        if   type == self.FORMAT_TYPE_NONE:
+            out = baseword
+        elif type == self.FORMAT_TYPE_PREFIX:
+            out = pre + baseword
+        elif type == self.FORMAT_TYPE_SUFFIX:
+            out = baseword + suf
+        else: #prefix+suffix
+            #out = format % (baseword)
+            out = pre + baseword + suf
+
+        return out
+
+    # when reversing format/word are lowercase, but we have regular case saved to get original combo
+    def _get_original_case(self, format_og, word, joiner):
+        if self._args.permutations:
+            word_og = []
+            i = 0
             for subword in word:
                 subword_og = self._sections[i][subword]
                 i += 1
@@ -1182,8 +3293,17 @@ class Words(object):
             return
 
         inname = self._args.output_file
+        names = self._read_results(inname)
+        if names is None:
+            return
+        lines = self._get_results_lines(names, self._contexts)
 
-        # separate fnv + hash(es)
+        outname = inname #.replace('.txt', '-order.txt')
+        with open(outname, 'w') as f:
+           f.write('\n'.join(lines))
+
+    # separate fnv + hash(es)
+    def _read_results(self, inname):
         names = {}
         try:
             with open(inname, 'r') as f:
@@ -1201,21 +3321,23 @@ class Words(object):
                         names[fnv] = []
                     names[fnv].append(name)
         except FileNotFoundError:
-            return
+            return None
+        return names
 
+    def _get_results_lines(self, names, contexts):
         if self._args.results_contexts:
             remove_repeats = True
         
             done = {} #fnv set
             lines = []
 
-            sections = self._sort_results_get_sections()
+            sections = self._sort_results_get_sections(contexts)
             for section in sections:
                 # note that the same key may be in multiple contexts (ignored by default)
 
                 # mark names per section and repeats
                 subitems = {}
-                for fnv in self._contexts[section]:
+                for fnv in contexts[section]:
                     if fnv in done and done[fnv] != section and remove_repeats:
                         continue
                     if fnv in names:
@@ -1245,10 +3367,7 @@ class Words(object):
             
         else:
             lines = self._sort_results_lines(names)
-
-        outname = inname #.replace('.txt', '-order.txt')
-        with open(outname, 'w') as f:
-           f.write('\n'.join(lines))
+        return lines
 
     def _sort_results_lines(self, subitems):
         lines = []
@@ -1267,11 +3386,11 @@ class Words(object):
             lines.append("%s: %s" % (fnv, name))
         return lines
 
-    def _sort_results_get_sections(self):
+    def _sort_results_get_sections(self, contexts):
         # put variables + values at the end, since they are simpler to clasify
         sections = []
         sections_vars = []
-        for section in self._contexts.keys():
+        for section in contexts.keys():
             if section and b'### VA' in section:
                 sections_vars.append(section)
             else:
@@ -1279,13 +3398,68 @@ class Words(object):
         sections.extend(sections_vars)
         return sections
 
+    # In batch mode all games (wwnames files) are reversed at once, so words are only hashed once for all of
+    # them, and results are also written to an output file per game (with only its FNVs).
+    def _get_batch_file(self, file):
+        base, ext = os.path.splitext(self._args.output_file)
+        game = re.sub(r'[^A-Za-z0-9]+', '_', os.path.splitext(file)[0]).strip('_')
+        return self.FILENAME_BATCH_EX % (base, game, ext)
+
+    # opens games' output files, and sets which games get results of each FNV
+    def _open_batch_files(self):
+        self._batch_targets = None
+        if not self._batch:
+            return []
+
+        self._batch_targets = {}
+        batchfiles = []
+        for index, (file, contexts) in enumerate(self._batch):
+            for keys in contexts.values():
+                for fnv in keys:
+                    batches = self._batch_targets.setdefault(fnv, [])
+                    if not batches or batches[-1] != index:
+                        batches.append(index)
+            batchfiles.append(open(self._get_batch_file(file), 'a' if self._resume else 'w'))
+        return batchfiles
+
+    # sorts games' output files, once all results are written
+    def _write_batch(self):
+        if not self._batch:
+            return
+
+        for file, contexts in self._batch:
+            outname = self._get_batch_file(file)
+            names = self._read_results(outname)
+            if names is None:
+                continue
+            if not names and self._args.delete_empty:
+                os.remove(outname)
+                continue
+
+            lines = self._get_results_lines(names, contexts)
+            with open(outname, 'w') as f:
+               f.write('\n'.join(lines))
+            print("wrote %s (%i FNVs)" % (outname, len(names)))
+
     #--------------------------------------------------------------------------
 
     def _preprocess_config(self):
-        if self._args.format_auto_prefix or self._args.format_auto_suffix or self._args.format_auto_mix:
+        if self._args.words_arena:
+            self._words = self._new_words()
+            self._sections = [self._words]
+        if self._args.reverse_batch:
+            self._batch = []
+        if self._args.checkpoint_interval is None:
+            self._args.checkpoint_interval = self.CHECKPOINT_INTERVAL if self._args.resume else 0
+        if self._args.format_auto_prefix or self._args.format_auto_suffix or self._args.format_auto_mix or self._args.format_auto_top:
             self._args.format_auto = True
 
 
+    def _new_words(self):
+        if self._args and self._args.words_arena:
+            return WordArena()
+        return {}
+
     def _postprocess_config(self):
         cb = self._args.combinations
         pt = self._args.permutations
@@ -1307,32 +3481,644 @@ class Words(object):
         self._args = self._parse()
         self._preprocess_config()
 
-        self._read_formats(self._args.formats_file)
+        try:
+            self._start()
+        finally:
+            self._stats.end_phase()
+            if self._args.stats_json:
+                self._stats.write_json(self._args.stats_json, self._args)
 
-        self._parsing_wwnames = True
-        files = glob.glob(self._args.wwnames_file)
-        for file in files:
-            if file == self._args.input_file:
-                continue
-            self._read_words(file)
-            self._read_reversables(file)
-        self._parsing_wwnames = False
+    def _start(self):
+        stats = self._stats
 
-        files = glob.glob(self._args.input_file)
-        for file in files:
-            self._read_words(file)
+        wwnames_files = glob.glob(self._args.wwnames_file)
+        wwnames_files = [file for file in wwnames_files if file != self._args.input_file]
+        input_files = glob.glob(self._args.input_file)
 
-        self._read_reversables(self._args.reverse_file, True)
-        self._read_skips(self._args.skips_file)
+        stats.start_phase('cache')
+        cache_file = self._get_cache_file(wwnames_files, input_files)
+        if not self._load_cache(cache_file):
+            stats.start_phase('formats')
+            self._read_formats(self._args.formats_file)
+
+            stats.start_phase('wwnames')
+            self._read_files(wwnames_files, True)
+            self._add_formats_auto_top()
+
+            stats.start_phase('words')
+            self._read_files(input_files, False)
+
+            if self._batch is None:
+                stats.start_phase('reversables')
+                self._read_reversables(self._args.reverse_file, True)
+
+            stats.start_phase('cache')
+            self._save_cache(cache_file)
 
         self._postprocess_config()
+        if not self._load_checkpoint():
+            return
+        stats.start_phase('skips')
+        self._read_skips(self._args.skips_file)
+
+        stats.start_phase('writing')
         self._write_words()
+        stats.start_phase('sorting')
         self._sort_results()
+        self._write_batch()
+
+###############################################################################
+
+# Timings and counters, to compare modes/flags and catch regressions. Hits and rates are only known
+# when reversing: candidates = words/combos * formats, fuzzy hits = FNVs found ignoring last char,
+# exact hits = FNVs found, written = results not in skips.
+class Stats(object):
+
+    def __init__(self):
+        self.fuzzy_hits = 0
+        self.exact_hits = 0
+        self.written = 0
+        self.joiners = {} #joiner: written results
+
+        self._phases = {} #name: [seconds, RSS at end]
+        self._phase = None
+        self._phase_time = None
+
+        self._total = 0
+        self._formats = 0
+        self._done = 0
+        self._done_before = 0 #when resuming
+        self._start_time = None
+        self._elapsed = 0
+
+    # phases may be repeated (times are added)
+    def start_phase(self, name):
+        self.end_phase()
+        self._phase = name
+        self._phase_time = time.time()
+
+    def end_phase(self):
+        if not self._phase:
+            return
+        elapsed = time.time() - self._phase_time
+        rss, _ = self.get_rss()
+        phase = self._phases.setdefault(self._phase, [0.0, None])
+        phase[0] += elapsed
+        phase[1] = rss
+        self._phase = None
+
+    def start_reverse(self, total, formats, done_before):
+        self._total = total
+        self._formats = formats
+        self._done_before = done_before
+        self._start_time = time.time()
+
+    # done: words/combos done since start
+    def update(self, done, written):
+        self._done = done
+        self.written = written
+        self._elapsed = time.time() - self._start_time
+
+    def get_done_before(self):
+        return self._done_before
+
+    def get_rate(self):
+        if not self._elapsed:
+            return 0
+        return self._done * self._formats / self._elapsed
+
+    def add_joiner(self, joiner):
+        joiner = str(joiner, 'utf-8')
+        self.joiners[joiner] = self.joiners.get(joiner, 0) + 1
+
+    def get_info(self):
+        rate = self.get_rate()
+        pending = self._total - self._done_before - self._done
+        eta = '?'
+        if self._done and pending >= 0:
+            eta = str(datetime.timedelta(seconds=int(pending * self._elapsed / self._done)))
+        rss, _ = self.get_rss()
+        rss = '%iMB' % (rss // 0x100000) if rss is not None else '?'
+
+        return "(%i candidates/s, %i fuzzy hits, %i exact hits, %i written, ETA %s, RSS %s)" % (
+            rate, self.fuzzy_hits, self.exact_hits, self.written, eta, rss)
+
+    # current and peak RSS, if the OS allows it (None otherwise)
+    def get_rss(self):
+        rss = None
+        peak = None
+        try:
+            with open('/proc/self/status', 'r') as infile:
+                for line in infile:
+                    if line.startswith('VmRSS:'):
+                        rss = int(line.split()[1]) * 1024
+                    elif line.startswith('VmHWM:'):
+                        peak = int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+        return rss, peak
+
+    def write_json(self, file, args):
+        rss, peak = self.get_rss()
+        stats = {
+            'args': vars(args),
+            'phases': {name: {'seconds': seconds, 'rss': rss} for name, (seconds, rss) in self._phases.items()},
+            'rss': rss,
+            'peak_rss': peak,
+            'total': self._total,
+            'formats': self._formats,
+            'done': self._done_before + self._done,
+            'candidates': (self._done_before + self._done) * self._formats,
+            'reverse_seconds': self._elapsed,
+            'candidates_per_second': self.get_rate(),
+            'fuzzy_hits': self.fuzzy_hits,
+            'exact_hits': self.exact_hits,
+            'written': self.written,
+            'joiners': self.joiners,
+        }
+        with open(file, 'w') as outfile:
+            json.dump(stats, outfile, indent=4)
+
+###############################################################################
+
+# Writes results in a separate thread, in batches. Reversing is most interesting with lots of
+# loops = slow, so results are flushed every now and then (to check the output while running),
+# but flushing every result is slow when there are many results.
+class ResultWriter(object):
+    FLUSH_TIME = 1.0 #max seconds until results are flushed
+    FLUSH_LINES = 0x1000
+
+    # batchfiles: extra outputs that get some results (see Words._write_batch)
+    def __init__(self, outfile, skipfile, batchfiles=None):
+        self._outfile = outfile
+        self._skipfile = skipfile
+        self._batchfiles = batchfiles or []
+        self._queue = queue.Queue()
+        self._error = None
+        self._done = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # batches: indexes of batchfiles that also get this line
+    def write(self, line, skip_line, batches=None):
+        self._check_error()
+        self._queue.put( (line, skip_line, batches) )
+
+    # writes pending results and returns current file offsets
+    def sync(self):
+        event = threading.Event()
+        self._queue.put(event)
+        event.wait()
+        self._check_error()
+
+        skip_offset = 0
+        if self._skipfile:
+            skip_offset = self._skipfile.tell()
+        batch_offsets = [batchfile.tell() for batchfile in self._batchfiles]
+        return self._outfile.tell(), skip_offset, batch_offsets
+
+    # writes pending results and stops
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._check_error()
+
+    # errors in the thread (disk full, etc) are raised in the main thread on next call
+    def _check_error(self):
+        if self._error:
+            raise self._error
+
+    def _run(self):
+        try:
+            self._write_queue()
+        except Exception as e:
+            self._error = e
+            # keep releasing syncs until closed, so they get the error instead of waiting forever
+            while not self._done:
+                item = self._queue.get()
+                if item is None:
+                    self._done = True
+                elif isinstance(item, threading.Event):
+                    item.set()
+
+    def _write_queue(self):
+        lines = []
+        skip_lines = []
+        batch_lines = [[] for _ in self._batchfiles]
+        flush_time = time.time() + self.FLUSH_TIME
+        done = False
+
+        while not done:
+            timeout = max(0, flush_time - time.time())
+            sync = None
+            try:
+                item = self._queue.get(timeout=timeout)
+                if item is None:
+                    done = True
+                    self._done = True
+                elif isinstance(item, threading.Event):
+                    sync = item
+                else:
+                    lines.append(item[0])
+                    if item[1]:
+                        skip_lines.append(item[1])
+                    for batch in item[2] or []:
+                        batch_lines[batch].append(item[0])
+            except queue.Empty:
+                pass
+
+            if not done and not sync and len(lines) < self.FLUSH_LINES and time.time() < flush_time:
+                continue
+
+            try:
+                if lines:
+                    self._outfile.write(''.join(lines))
+                    self._outfile.flush()
+                    if self._skipfile:
+                        self._skipfile.write(''.join(skip_lines))
+                    for batchfile, blines in zip(self._batchfiles, batch_lines):
+                        if blines:
+                            batchfile.write(''.join(blines))
+                            blines.clear()
+                    lines = []
+                    skip_lines = []
+                if sync:
+                    if self._skipfile:
+                        self._skipfile.flush()
+                    for batchfile in self._batchfiles:
+                        batchfile.flush()
+            finally:
+                if sync:
+                    sync.set()
+            flush_time = time.time() + self.FLUSH_TIME
+
+###############################################################################
+
+# Skipped names as a sorted list of 64-bit hashes, that is read with mmap + binary search
+# (so memory/load time doesn't grow with skips). New skips go to a (name).log file of hashes,
+# merged into the sorted list once it gets big enough (when closing, or when opening if a previous
+# run left a big log). The bloom filter is saved as (name).bloom when merging, and read with mmap.
+class SkipsStore(object):
+    COMPACT_RATIO = 8 #merge log when it has more than 1/N of sorted hashes
+    LOG_MAX = 0x40000 #merge log when opening if it has more hashes than this
+    CHUNK = 0x100000
+    BLOOM_INFO = '<QQQQ' #version, hashes, bits, last hash (at the end of the bloom file)
+    BLOOM_VERSION = 2 #change when bloom positions change
+    BLOOM_PROBES = 3
+
+    # compact: may merge a big log when opening (not when resuming, as the checkpoint has log offsets)
+    def __init__(self, path, bloom_mb=None, compact=True):
+        self._path = path
+        self._path_log = path + '.log'
+        self._path_bloom = path + '.bloom'
+
+        self._bloom = None
+        self._bloom_bits = 0
+        if bloom_mb:
+            self._bloom_bits = 1
+            while self._bloom_bits < bloom_mb * 0x800000:
+                self._bloom_bits *= 2
+
+        self._open()
+
+        self._log = set()
+        try:
+            log_count = os.path.getsize(self._path_log) // 8
+        except FileNotFoundError:
+            log_count = 0
+        if compact and log_count > self.LOG_MAX:
+            self._compact(self._read_log())
+            self._open()
+        elif log_count:
+            self._log.update(self._read_log())
+        self._logfile = open(self._path_log, 'ab')
+
+        if self._bloom_bits:
+            self._load_bloom()
+
+    @staticmethod
+    def get_key(name_lw):
+        return int.from_bytes(hashlib.blake2b(name_lw, digest_size=8).digest(), 'little')
+
+    @staticmethod
+    def create(path, names):
+        keys = array.array('Q', sorted(set(SkipsStore.get_key(name) for name in names)))
+        with open(path, 'wb') as outfile:
+            outfile.write(keys.tobytes())
+        try:
+            os.remove(path + '.bloom')
+        except FileNotFoundError:
+            pass
+
+    def _open(self):
+        self._infile = open(self._path, 'rb')
+        self._count = os.path.getsize(self._path) // 8
+        self._mmap = None
+        if self._count:
+            self._mmap = mmap.mmap(self._infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _read_log(self):
+        with open(self._path_log, 'rb') as infile:
+            data = infile.read()
+        items = array.array('Q')
+        items.frombytes(data[:len(data) // 8 * 8])
+        return items
+
+    # saved bloom is only used if made from the current sorted list (otherwise it's made again)
+    def _load_bloom(self):
+        last = struct.unpack_from('<Q', self._mmap, (self._count - 1) * 8)[0] if self._mmap else 0
+        info = (self.BLOOM_VERSION, self._count, self._bloom_bits, last)
+
+        for _ in range(2):
+            try:
+                with open(self._path_bloom, 'rb') as infile:
+                    bloom = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+                info_size = struct.calcsize(self.BLOOM_INFO)
+                if len(bloom) == self._bloom_bits // 8 + info_size and struct.unpack_from(self.BLOOM_INFO, bloom, len(bloom) - info_size) == info:
+                    self._bloom = bloom
+                    self._bloom_mask = self._bloom_bits - 1
+                    return
+                bloom.close()
+            except FileNotFoundError:
+                pass
+            self._save_bloom(info)
+
+    def _save_bloom(self, info):
+        bits = self._bloom_bits
+        mask = bits - 1
+        bloom = bytearray(bits // 8)
+        if self._mmap:
+            for key, in struct.iter_unpack('<Q', self._mmap):
+                for pos in self._get_bloom_positions(key, mask):
+                    bloom[pos >> 3] |= 1 << (pos & 7)
+
+        path_tmp = self._path_bloom + '.tmp'
+        with open(path_tmp, 'wb') as outfile:
+            outfile.write(bloom)
+            outfile.write(struct.pack(self.BLOOM_INFO, *info))
+        os.replace(path_tmp, self._path_bloom)
+
+    # double hashing with each half of the key (independent bits, unlike shifts of the same key)
+    def _get_bloom_positions(self, key, mask):
+        h1 = key & 0xFFFFFFFF
+        h2 = (key >> 32) | 1
+        return [(h1 + i * h2) & mask for i in range(self.BLOOM_PROBES)]
+
+    def _in_bloom(self, key):
+        mask = self._bloom_mask
+        bloom = self._bloom
+        for pos in self._get_bloom_positions(key, mask):
+            if not bloom[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def _in_sorted(self, key):
+        mm = self._mmap
+        lo = 0
+        hi = self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            val = struct.unpack_from('<Q', mm, mid * 8)[0]
+            if val < key:
+                lo = mid + 1
+            elif val > key:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def __contains__(self, name_lw):
+        key = self.get_key(name_lw)
+        if key in self._log:
+            return True
+        if not self._mmap:
+            return False
+        if self._bloom and not self._in_bloom(key):
+            return False
+        return self._in_sorted(key)
+
+    def add(self, name_lw):
+        key = self.get_key(name_lw)
+        if key in self._log:
+            return
+        self._log.add(key)
+        self._logfile.write(struct.pack('<Q', key))
+
+    # returns current log offset
+    def sync(self):
+        self._logfile.flush()
+        return self._logfile.tell()
+
+    def close(self, compact=True):
+        self._logfile.close()
+        if self._bloom:
+            self._bloom.close()
+
+        compact = compact and len(self._log) * self.COMPACT_RATIO > self._count
+        if compact:
+            self._compact(self._log)
+            if self._bloom_bits:
+                self._open()
+                self._load_bloom() #saves bloom for next time
+                self._bloom.close()
+
+        if self._mmap:
+            self._mmap.close()
+        if self._infile:
+            self._infile.close()
+
+    # merges log keys into the sorted list (and removes the log)
+    def _compact(self, log):
+        sorted_keys = (key for key, in struct.iter_unpack('<Q', self._mmap)) if self._mmap else []
+        keys = heapq.merge(sorted_keys, sorted(log))
+
+        path_tmp = self._path + '.tmp'
+        with open(path_tmp, 'wb') as outfile:
+            chunk = array.array('Q')
+            prev = None
+            for key in keys:
+                if key == prev:
+                    continue
+                prev = key
+                chunk.append(key)
+                if len(chunk) >= self.CHUNK:
+                    outfile.write(chunk.tobytes())
+                    chunk = array.array('Q')
+            outfile.write(chunk.tobytes())
+
+        if self._mmap:
+            self._mmap.close()
+        self._infile.close()
+        self._mmap = self._infile = None
+
+        os.replace(path_tmp, self._path)
+        os.remove(self._path_log)
+
+###############################################################################
+
+# Words as a dict-like of lowercase -> original case, stored in a single bytearray of lowercase words
+# (+ end offsets) instead of two bytes objects per word. Original case is only kept for words that differ
+# (in a second bytearray, with its start per word or -1).
+# Meant for huge word lists (much less memory, but slower to add words as lookups are done in python).
+# Words are found with an open addressing table of word indexes (-1 = free slot), by crc32 (unlike
+# hash() it's the same in other processes, so it can be pickled to jobs/cache).
+class WordArena(object):
+    MIN_SLOTS = 0x400
+
+    def __init__(self):
+        self._data = bytearray()
+        self._ends = array.array('Q')
+        self._hashes = array.array('I')
+        self._cases = array.array('q')
+        self._cases_data = bytearray()
+        self._slots = array.array('i', [-1]) * self.MIN_SLOTS
+        self._mask = self.MIN_SLOTS - 1
+
+    def __len__(self):
+        return len(self._ends)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, key):
+        return self._find(key, zlib.crc32(key))[1] >= 0
+
+    def __getitem__(self, key):
+        index = self._find(key, zlib.crc32(key))[1]
+        if index < 0:
+            raise KeyError(key)
+        return self.get_word(index, True)
+
+    # same as dicts: keeps position of first add, and last value
+    def __setitem__(self, key, value):
+        crc = zlib.crc32(key)
+        slot, index = self._find(key, crc)
+        if index < 0:
+            index = len(self._ends)
+            self._data += key
+            self._ends.append(len(self._data))
+            self._hashes.append(crc)
+            self._cases.append(-1)
+            self._slots[slot] = index
+            if index * 2 > self._mask:
+                self._grow()
+
+        # case changes are written in place (same size), so re-reading words doesn't add data
+        start = self._cases[index]
+        if start >= 0 and len(value) == len(key):
+            self._cases_data[start:start + len(value)] = value
+            return
+        if value == key:
+            self._cases[index] = -1
+            return
+        self._cases[index] = len(self._cases_data)
+        self._cases_data += value
+
+    def update(self, items):
+        if hasattr(items, 'items'):
+            items = items.items()
+        for key, value in items:
+            self[key] = value
+
+    def keys(self):
+        return WordArenaView(self, False)
+
+    def values(self):
+        return WordArenaView(self, True)
+
+    def items(self):
+        return zip(self.keys(), self.values())
+
+    def get_word(self, index, original=False):
+        start = self._ends[index - 1] if index else 0
+        end = self._ends[index]
+        if original and self._cases[index] >= 0:
+            case = self._cases[index]
+            return bytes(self._cases_data[case:case + end - start])
+        return bytes(self._data[start:end])
+
+    # (slot, word index) of key, or (free slot, -1) if not found
+    def _find(self, key, crc):
+        data = self._data
+        ends = self._ends
+        hashes = self._hashes
+        slots = self._slots
+        mask = self._mask
+
+        slot = crc & mask
+        while True:
+            index = slots[slot]
+            if index < 0:
+                return slot, -1
+            if hashes[index] == crc:
+                start = ends[index - 1] if index else 0
+                if data[start:ends[index]] == key:
+                    return slot, index
+            slot = (slot + 1) & mask
+
+    def _grow(self):
+        size = (self._mask + 1) * 2
+        slots = array.array('i', [-1]) * size
+        mask = size - 1
+        for index, crc in enumerate(self._hashes):
+            slot = crc & mask
+            while slots[slot] >= 0:
+                slot = (slot + 1) & mask
+            slots[slot] = index
+        self._slots = slots
+        self._mask = mask
+
+# Sequence of arena words (lowercase or original case, plus an optional prefix like a joiner),
+# without making a list of all words.
+class WordArenaView(object):
+    CHUNK = 0x1000
+
+    def __init__(self, arena, original, prefix=b''):
+        self._arena = arena
+        self._original = original
+        self._prefix = prefix
+
+    def joined(self, prefix):
+        return WordArenaView(self._arena, self._original, prefix + self._prefix)
+
+    def __len__(self):
+        return len(self._arena)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError(index)
+        return self._prefix + self._arena.get_word(index, self._original)
+
+    # words are sliced from the arena in chunks, so the arena isn't locked (memoryview) between yields
+    def __iter__(self):
+        arena = self._arena
+        original = self._original
+        prefix = self._prefix
+        cases = arena._cases
+        ends = arena._ends
+        start = 0
+        for first in range(0, len(ends), self.CHUNK):
+            with memoryview(arena._data) as view, memoryview(arena._cases_data) as cases_view:
+                words = []
+                for index in range(first, min(first + self.CHUNK, len(ends))):
+                    end = ends[index]
+                    case = cases[index]
+                    if original and case >= 0:
+                        words.append(prefix + cases_view[case:case + end - start].tobytes())
+                    else:
+                        words.append(prefix + view[start:end].tobytes())
+                    start = end
+            yield from words
 
 ###############################################################################
 
 class Fnv(object):
     FNV_DICT = b'0123456789abcdefghijklmnopqrstuvwxyz_'
+    FNV_PRIME_INV = 899433627 #modular inverse of the FNV prime (mod 2^32), see fnv.c
     FNV_FORMAT = re.compile(b"^[a-z_][a-z0-9\_]*$")
     FNV_FORMAT_EX = re.compile(b"^[a-z_0-9][a-z0-9_()\- ]*$")
 
@@ -1352,6 +4138,13 @@ class Fnv(object):
         #namebytes = bytearray(lowname, 'UTF-8')
         namebytes = lowname
         basehash = self._get_hash(namebytes[:-1]) #up to last byte
+        return self.unfuzzy_hashname_hash(id, basehash, hashname)
+
+    # Same as the above when the hash up to last byte is already known
+    def unfuzzy_hashname_hash(self, id, basehash, hashname):
+        if not id or not hashname:
+            return None
+
         for c in self.FNV_DICT: #try each last char
             id_hash = self._get_partial_hash(basehash, c)  #ord(c) #already byte
 
@@ -1400,6 +4193,30 @@ class Fnv(object):
     def get_hash_nb(self, namebytes):
         return self._get_hash(namebytes)
 
+    # Inverse FNV-1: gets the hash before applying namebytes ("unhash" of 'suffix' from hash("name_suffix") = hash("name_"))
+    def get_unhash_nb(self, hash, namebytes):
+        for namebyte in reversed(namebytes):
+            hash = hash ^ namebyte #FNV xor
+            hash = hash * self.FNV_PRIME_INV #FNV prime inverse
+            hash = hash & 0xFFFFFFFF #python clamp
+        return hash
+
+# #####################################
+
+# multiprocessing helpers (must be top-level)
+_job_words = None
+
+def _init_job(words):
+    global _job_words
+    _job_words = words
+
+def _run_job(shard):
+    start, end = shard
+    return _job_words._reverse_words_shard(start, end)
+
+def _run_read(file):
+    return _job_words._read_file_job(file)
+
 # #####################################
 
 if __name__ == "__main__":